@@ -0,0 +1,219 @@
+"""
+Synthetic EpiDoc corpus generator for the scaling benchmarks.
+
+Documents are modelled on the files in data/xmls: the same teiHeader layout,
+support/origin/provenance references into the authority files, an edition div
+or several textparts with lb, w, expan/abbr/ex, supplied, gap, unclear, g and
+persName/placeName markup, an apparatus, bilingual translation and commentary,
+and bibl references into data/bibliography.xml. Words, titles and translations
+are drawn from the real corpus, so text lengths and scripts stay realistic.
+
+    python benchmarks/generate_corpus.py 10000 /tmp/corpus-10k
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA_DIR = ROOT / "data"
+
+TEI = "{http://www.tei-c.org/ns/1.0}"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+
+class Vocabulary:
+    """Words, titles and authority ids harvested from the shipped data."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        data_dir = Path(data_dir)
+        self.words = set()
+        self.titles = []
+        self.english = []
+        for path in sorted((data_dir / "xmls").glob("*.xml")):
+            root = ET.parse(path).getroot()
+            for w in root.iter(f"{TEI}w"):
+                word = "".join(w.itertext()).strip()
+                if word and " " not in word:
+                    self.words.add(word)
+            for title in root.iter(f"{TEI}title"):
+                if title.get(XML_LANG) == "en" and title.text:
+                    self.titles.append(title.text.strip())
+            for div in root.iter(f"{TEI}div"):
+                if div.get("type") in ("translation", "commentary"):
+                    for seg in div.iter(f"{TEI}seg"):
+                        if seg.get(XML_LANG) == "en":
+                            self.english.extend(re.findall(r"[A-Za-z]+", "".join(seg.itertext())))
+        self.words = sorted(self.words)
+
+        auth = data_dir / "authority"
+        self.materials = self._items(auth / "materials.json")
+        self.objects = self._items(auth / "objects.json")
+        self.origlocs = self._items(auth / "origloc.json", "placeName")
+        self.findspots = self._items(auth / "Findspot.json", "placeName")
+        self.currentlocs = self._items(auth / "currentloc.json", "placeName")
+        self.places = self._items(auth / "places.json", "placeName")
+        self.genres = self._items(auth / "inscription_type_genres.json")
+        biblio = ET.parse(data_dir / "bibliography.xml").getroot()
+        self.bibl_ids = [e.get("{http://www.w3.org/XML/1998/namespace}id")
+                         for e in biblio.iter() if e.get("{http://www.w3.org/XML/1998/namespace}id")]
+
+    @staticmethod
+    def _items(path, term_key="term"):
+        """Return (id, english label) pairs of an authority file."""
+        with open(path, encoding="utf-8") as f:
+            body = next(iter(json.load(f).values()))["body"]
+        items = body["list"]["item"] if "list" in body else body["listPlace"]["place"]
+        pairs = []
+        for item in items:
+            terms = item.get(term_key, [])
+            terms = terms if isinstance(terms, list) else [terms]
+            label = next((t.get("__text", "") for t in terms if t.get("_xml:lang") == "en"), "")
+            pairs.append((item["_xml:id"], label.strip() or item["_xml:id"]))
+        return pairs
+
+
+def _edition_line(rng, vocab, n):
+    """One <lb/> line of Leiden-encoded words."""
+    parts = [f'<lb n="{n}"/>']
+    for _ in range(rng.randint(2, 7)):
+        word = rng.choice(vocab.words)
+        roll = rng.random()
+        if roll < 0.08 and len(word) > 2:
+            cut = rng.randint(1, len(word) - 1)
+            parts.append(f"<w><expan><abbr>{escape(word[:cut])}</abbr><ex>{escape(word[cut:])}</ex></expan></w>")
+        elif roll < 0.16:
+            parts.append(f'<supplied reason="lost">{escape(word)}</supplied>')
+        elif roll < 0.22:
+            parts.append(f'<gap reason="lost" quantity="{rng.randint(1, 6)}" unit="character"/>')
+        elif roll < 0.25:
+            parts.append('<gap reason="lost" extent="unknown" unit="character"/>')
+        elif roll < 0.30:
+            parts.append(f"<unclear>{escape(word)}</unclear>")
+        elif roll < 0.33:
+            parts.append('<g type="cross"/>')
+        elif roll < 0.38:
+            parts.append(f'<persName ref="names.xml#n{rng.randint(1, 60):03d}">{escape(word)}</persName>')
+        elif roll < 0.40:
+            place_id, _ = rng.choice(vocab.places)
+            parts.append(f'<placeName ref="places.xml#{place_id}">{escape(word)}</placeName>')
+        elif roll < 0.43:
+            parts.append(f'<hi rend="supraline">{escape(word)}</hi>')
+        else:
+            parts.append(f"<w>{escape(word)}</w>")
+    return " ".join(parts)
+
+
+def _ab(rng, vocab):
+    lines = [_edition_line(rng, vocab, n) for n in range(1, rng.randint(2, 12) + 1)]
+    return "<ab>\n" + "\n".join(lines) + "\n</ab>"
+
+
+def _sentence(rng, vocab, low, high):
+    return " ".join(rng.choice(vocab.english) for _ in range(rng.randint(low, high)))
+
+
+def generate_document(index, rng, vocab):
+    """Return the XML text of one synthetic inscription."""
+    ident = f"syn-{index:06d}"
+    title = f"{rng.choice(vocab.titles)} ({ident})"
+    material_id, material = rng.choice(vocab.materials)
+    object_id, object_type = rng.choice(vocab.objects)
+    origin_id, origin = rng.choice(vocab.origlocs)
+    findspot_id, findspot = rng.choice(vocab.findspots)
+    current_id, current = rng.choice(vocab.currentlocs)
+    genre_id, genre = rng.choice(vocab.genres)
+    start = rng.randint(900, 1450)
+    end = start + rng.choice((0, 9, 49, 99))
+
+    if rng.random() < 0.2:
+        edition = "\n".join(
+            f'<div type="textpart" n="{n}" xml:space="preserve" xml:lang="chu">\n{_ab(rng, vocab)}\n</div>'
+            for n in ("I", "II", "III")[:rng.randint(2, 3)])
+    else:
+        edition = f'<div type="edition" xml:space="preserve" xml:lang="chu">\n{_ab(rng, vocab)}\n</div>'
+    apparatus = "\n".join(
+        f'<app loc="{rng.randint(1, 8)}"><note>{escape(_sentence(rng, vocab, 3, 10))}</note></app>'
+        for _ in range(rng.randint(0, 3)))
+    bibls = "\n".join(f'<bibl sameAs="bib:{rng.choice(vocab.bibl_ids)}">{rng.randint(1, 400)}</bibl>'
+                      for _ in range(rng.randint(1, 3)))
+    translation = escape(_sentence(rng, vocab, 5, 40))
+    commentary = escape(_sentence(rng, vocab, 20, 150))
+
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
+<teiHeader>
+<fileDesc>
+<titleStmt>
+<title xml:lang="en">{escape(title)}</title>
+<editor><persName xml:lang="en">Synthetic Editor {index % 7}</persName></editor>
+</titleStmt>
+<publicationStmt><authority>Bashtina Project</authority><idno type="filename">{ident}</idno></publicationStmt>
+<sourceDesc><msDesc>
+<msIdentifier><country>Bulgaria</country>
+<altIdentifier xml:lang="en"><repository><ref>Museum {index % 23}</ref></repository><idno>{index}</idno></altIdentifier>
+</msIdentifier>
+<msContents><summary corresp={quoteattr(f"inscription_type_genres.xml#{genre_id}")}><seg xml:lang="en">{escape(genre)}</seg></summary></msContents>
+<physDesc><objectDesc><supportDesc><support>
+<material xml:lang="en" ref="materials.xml#{material_id}">{escape(material)}</material>
+<objectType xml:lang="en" ref="objects.xml#{object_id}">{escape(object_type)}</objectType>
+<dimensions><height unit="cm">{rng.randint(10, 200)}</height><width unit="cm">{rng.randint(10, 120)}</width><depth unit="cm">{rng.randint(2, 60)}</depth></dimensions>
+</support></supportDesc>
+<layoutDesc><layout xml:lang="en">{escape(_sentence(rng, vocab, 4, 12))}</layout></layoutDesc>
+</objectDesc>
+<handDesc><handNote xml:lang="en">Letter size: <height unit="cm">{rng.randint(1, 6)}</height></handNote></handDesc>
+</physDesc>
+<history>
+<origin>
+<origPlace ref="origloc.xml#{origin_id}"><seg xml:lang="en">{escape(origin)}</seg></origPlace>
+<origDate notBefore="{start}" notAfter="{end}"><seg xml:lang="en">{start}-{end}</seg></origDate>
+</origin>
+<provenance type="found" when="{rng.randint(1850, 2020)}"><seg xml:lang="en"><placeName ref="Findspot.xml#{findspot_id}">{escape(findspot)}</placeName></seg></provenance>
+<provenance type="observed"><seg xml:lang="en"><placeName ref="currentloc.xml#{current_id}">{escape(current)}</placeName></seg></provenance>
+</history>
+</msDesc></sourceDesc>
+</fileDesc>
+</teiHeader>
+<facsimile><graphic url="{ident}.jpg"/></facsimile>
+<text><body>
+{edition}
+<div type="apparatus"><listApp><head xml:lang="en">Apparatus:</head>
+{apparatus}
+</listApp></div>
+<div type="translation"><p><seg xml:lang="en">{translation}</seg></p></div>
+<div type="commentary"><p><seg xml:lang="en"><note>{commentary}</note></seg></p></div>
+<div type="bibliography"><listBibl>
+{bibls}
+</listBibl></div>
+</body></text>
+</TEI>
+"""
+
+
+def generate_corpus(count, out_dir, seed=0, vocab=None):
+    """Write count synthetic documents into out_dir/xmls; return that folder."""
+    rng = random.Random(seed)
+    vocab = vocab or Vocabulary()
+    xml_dir = Path(out_dir) / "xmls"
+    xml_dir.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        (xml_dir / f"syn-{index:06d}.xml").write_text(generate_document(index, rng, vocab), encoding="utf-8")
+    return xml_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic EpiDoc corpus.")
+    parser.add_argument("count", type=int)
+    parser.add_argument("out_dir")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    xml_dir = generate_corpus(args.count, args.out_dir, args.seed)
+    print(f"Wrote {args.count} documents to {xml_dir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
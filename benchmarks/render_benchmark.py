@@ -0,0 +1,212 @@
+"""
+Throughput and golden-output check of the Leiden renderer.
+
+Every edition/textpart div of data/xmls is rendered, together with generated
+stress cases: deeply nested <supplied>, thousands of <lb> and every <gap> and
+<space> variant. The throughput of each case is reported in elements per
+second (best of --repeat runs). Every output is compared with the golden files
+in benchmarks/golden, one JSON file of {div path: Leiden text} per case, so an
+optimised renderer can be swapped in and checked for identical output:
+
+    python benchmarks/render_benchmark.py
+    python benchmarks/render_benchmark.py --renderer my_leiden:format_leiden_text
+    python benchmarks/render_benchmark.py --update   # after an intended output change
+
+The exit status is 1 if any output differs from (or has no) golden file.
+"""
+import argparse
+import importlib
+import itertools
+import json
+import platform
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DATA_DIR = ROOT / "data"
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+TEI = "{http://www.tei-c.org/ns/1.0}"
+DEFAULT_RENDERER = "leiden:format_leiden_text"
+
+NESTING_DEPTH = 2000
+LINE_COUNT = 5000
+SUPPLIED_REASONS = ("lost", "omitted", "undefined", "subaudible", None)
+WORDS = ("азъ", "врана", "сътворихъ", "града", "мѣсѧца", "молитвѫ", "црквь", "камен")
+
+
+def tei(tag, text=None, tail=None, **attributes):
+    """A TEI element; attributes given as None are left out."""
+    elem = ET.Element(f"{TEI}{tag}", {key: value for key, value in attributes.items() if value is not None})
+    elem.text = text
+    elem.tail = tail
+    return elem
+
+
+def edition_divs(path):
+    """{div path: div} of the top-level edition and textpart divs of a TEI file, as records key them."""
+    body = ET.parse(path).getroot().find(f"{TEI}text/{TEI}body")
+    return {f"text/body/div[{i}]": div for i, div in enumerate(body.findall(f"{TEI}div"), 1)
+            if div.get("type") in ("edition", "textpart")}
+
+
+def deep_supplied(depth=NESTING_DEPTH):
+    """<supplied> nested depth levels deep, cycling through the reasons and certainties."""
+    div = tei("div", type="edition")
+    parent = div
+    for level in range(depth):
+        reason = SUPPLIED_REASONS[level % len(SUPPLIED_REASONS)]
+        child = tei("supplied", WORDS[level % len(WORDS)][:2], WORDS[(level + 1) % len(WORDS)][-1],
+                    reason=reason, cert="low" if level % 3 == 0 else None)
+        parent.append(child)
+        parent = child
+    return div
+
+
+def many_lines(count=LINE_COUNT):
+    """An <ab> of count lines (every third continuing a word) of words, expansions and separators."""
+    div = tei("div", type="edition")
+    ab = tei("ab", "\n")
+    div.append(ab)
+    for n in range(1, count + 1):
+        ab.append(tei("lb", tail=" ", n=str(n), **{"break": "no" if n % 3 == 0 else None}))
+        ab.append(tei("w", WORDS[n % len(WORDS)], " "))
+        word = WORDS[(n + 3) % len(WORDS)]
+        expan = tei("expan", tail=" ")
+        expan.append(tei("abbr", word[:2]))
+        expan.append(tei("ex", word[2:], cert="low" if n % 5 == 0 else None))
+        ab.append(expan)
+        ab.append(tei("g", tail="\n", type=("cross", "dipunct", "dot", "leaf")[n % 4]))
+    return div
+
+
+def gap_variants():
+    """One <gap> for every combination of the attributes the renderer reads, then every <space>."""
+    div = tei("div", type="edition")
+    ab = tei("ab")
+    div.append(ab)
+    options = {
+        "reason": (None, "lost", "ellipsis"),
+        "unit": (None, "character", "line"),
+        "quantity": (None, "3"),
+        "extent": (None, "unknown"),
+        "precision": (None, "low"),
+        "atLeast": (None, "2"),
+        "atMost": (None, "4"),
+        "cert": (None, "low"),
+    }
+    for n, values in enumerate(itertools.product(*options.values()), 1):
+        ab.append(tei("lb", n=str(n)))
+        ab.append(tei("gap", tail=" а ", **dict(zip(options, values))))
+    for unit, quantity, extent in itertools.product((None, "character", "line"), (None, "2"), (None, "unknown")):
+        ab.append(tei("space", tail=" б ", unit=unit, quantity=quantity, extent=extent))
+    return div
+
+
+STRESS_CASES = {
+    "stress-deep_supplied": deep_supplied,
+    "stress-many_lines": many_lines,
+    "stress-gap_variants": gap_variants,
+}
+
+
+def cases(data_dir=DATA_DIR):
+    """(case name, {div path: div}) of every data file, then of the stress cases."""
+    for path in sorted((Path(data_dir) / "xmls").glob("*.xml")):
+        yield path.stem, edition_divs(path)
+    for name, build in STRESS_CASES.items():
+        yield name, {"text/body/div[1]": build()}
+
+
+def load_renderer(spec):
+    """The function named by "module:function"."""
+    module, _, function = spec.partition(":")
+    return getattr(importlib.import_module(module), function or "format_leiden_text")
+
+
+def run_case(renderer, divs, repeat):
+    """(outputs, elements, best seconds) of rendering every div repeat times."""
+    elements = sum(sum(1 for _ in div.iter()) - 1 for div in divs.values())
+    best = None
+    outputs = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = {key: renderer(div) for key, div in divs.items()}
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return outputs, elements, best
+
+
+def compare(outputs, golden):
+    """Description of the first difference between outputs and the golden ones, or None."""
+    if golden is None:
+        return "no golden file"
+    for key in sorted(set(outputs) | set(golden)):
+        if key not in golden or key not in outputs:
+            return f"{key}: {'not in the golden file' if key not in golden else 'not rendered'}"
+        got, expected = outputs[key], golden[key]
+        if got != expected:
+            at = next((i for i, (a, b) in enumerate(zip(got, expected)) if a != b), min(len(got), len(expected)))
+            return f"{key}: differs at character {at}: {got[at:at + 30]!r} instead of {expected[at:at + 30]!r}"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the Leiden renderer and check it against golden output.")
+    parser.add_argument("--renderer", default=DEFAULT_RENDERER,
+                        help=f"module:function taking a div element (default: {DEFAULT_RENDERER})")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the best is reported")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--golden-dir", default=str(GOLDEN_DIR))
+    parser.add_argument("--update", action="store_true", help="write the outputs as the new golden files")
+    parser.add_argument("--output", help="also write the timings as JSON")
+    args = parser.parse_args(argv)
+
+    renderer = load_renderer(args.renderer)
+    golden_dir = Path(args.golden_dir)
+    if args.update:
+        golden_dir.mkdir(parents=True, exist_ok=True)
+    report = {"renderer": args.renderer, "python": platform.python_version(), "cases": {}}
+    failures = 0
+    total_elements = total_seconds = 0
+    print(f"{'case':24} {'elements':>9} {'seconds':>9} {'elements/s':>11}  output")
+    for name, divs in cases(args.data_dir):
+        golden_path = golden_dir / f"{name}.json"
+        try:
+            outputs, elements, seconds = run_case(renderer, divs, max(1, args.repeat))
+        except Exception as e:  # e.g. a recursive renderer on the nesting case
+            failures += 1
+            report["cases"][name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:24} {'':>9} {'':>9} {'':>11}  FAILED {type(e).__name__}: {e}")
+            continue
+        if args.update:
+            golden_path.write_text(json.dumps(outputs, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+            status = "updated"
+        else:
+            golden = json.loads(golden_path.read_text(encoding="utf-8")) if golden_path.exists() else None
+            difference = compare(outputs, golden)
+            status = "ok" if difference is None else f"DIFFERS {difference}"
+            failures += difference is not None
+        total_elements += elements
+        total_seconds += seconds
+        rate = elements / seconds if seconds else 0.0
+        report["cases"][name] = {"elements": elements, "seconds": round(seconds, 6),
+                                 "elements_per_second": round(rate), "output": status}
+        print(f"{name:24} {elements:9d} {seconds:9.4f} {rate:11.0f}  {status}")
+
+    rate = total_elements / total_seconds if total_seconds else 0.0
+    report["total"] = {"elements": total_elements, "seconds": round(total_seconds, 6),
+                       "elements_per_second": round(rate)}
+    print(f"{'total':24} {total_elements:9d} {total_seconds:9.4f} {rate:11.0f}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    if failures:
+        print(f"{failures} case(s) failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+"""
+Scaling benchmarks for the corpus pipeline, run headless on synthetic corpora.
+
+For every corpus size the stages below are timed, then run again under
+tracemalloc for their peak Python allocation (worker processes are not traced):
+
+    ingest_cold        parse and extract every file into an empty cache
+    ingest_warm        reload the corpus from a populated cache
+    ingest_rerender    parse every file into an empty cache that keeps the Leiden renderings of a
+                       previous run (as after a record format change)
+    snapshot_load      load a precompiled snapshot and seed the corpus from it
+    leiden_render      format_leiden_text over every edition/textpart div
+    leiden_long        format_leiden_text over one edition holding every div of the corpus (built
+                       untimed), flat and with each div nested in the previous one's <supplied>
+    leiden_targets     one render() walk producing the Leiden, HTML and search targets of every div
+                       (parsed untimed), against one walk per target
+    search             the Search & Query scan for a few terms and fields
+    search_index       the same queries ranked by the inverted index (built untimed), first page built
+    search_fuzzy       trigram fuzzy queries for partial and misspelled words
+    concordance_lines  KWIC lines from the positional index (built untimed), sorted by left context
+    structure_query    structural queries over the edition markup from the element index (built untimed)
+    facet_filter       combined facet filters with live counts over precomputed bitsets
+    referenced_places  extract_referenced_places for every record and authority file
+    network_build      Network View rows, data frame and graph
+
+The report is written as JSON; pass --compare with an earlier report to print
+the ratio of every timing and fail when a stage got slower than --threshold.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bibliography import format_bibl_entries, load_bibliography  # noqa: E402
+from concordance import ConcordanceIndex  # noqa: E402
+from corpus import RENDER_CACHE_FILE, Corpus  # noqa: E402
+from facets import record_facets  # noqa: E402
+from generate_corpus import Vocabulary, generate_corpus  # noqa: E402
+from leiden import TARGETS, format_leiden_text, render  # noqa: E402
+import map_view  # noqa: E402
+from network_data import load_authorities, network_frame, network_graph, network_record  # noqa: E402
+from search import SearchIndex, scan_records  # noqa: E402
+from snapshot import SNAPSHOT_FILE, build_snapshot, load_snapshot  # noqa: E402
+from structure import ElementIndex  # noqa: E402
+
+DATA_DIR = ROOT / "data"
+TEI = "{http://www.tei-c.org/ns/1.0}"
+
+SEARCH_QUERIES = [
+    ("stone", "All Fields"),
+    ("inscription", "Commentary"),
+    ("царь", "Church Slavonic Text"),
+    ("no-such-term", "All Fields"),
+]
+CONCORDANCE_FORMS = ["царь", "храмъ", "the", "stone"]
+FUZZY_QUERIES = ["камнь", "сватаго", "градакрцува", "поставихъ храмъ"]
+STRUCTURE_QUERIES = ['<gap unit="character">', '<supplied reason="lost">', '<g type="cross"> in textpart II',
+                     '<gap extent="unknown"> & <g type="cross">', '<* reason="lost">']
+PLACE_SOURCES = [("Origin", "origloc.json"), ("Findspot", "Findspot.json"),
+                 ("Current", "currentloc.json"), ("General", "places.json")]
+
+
+class Workload:
+    """One synthetic corpus plus everything the stages share, prepared untimed."""
+
+    def __init__(self, size, work_dir, workers, vocab):
+        self.size = size
+        self.workers = workers
+        self.data_dir = Path(work_dir) / f"corpus-{size}"
+        self.xml_dir = self.data_dir / "xmls"
+        if not self.xml_dir.is_dir() or len(os.listdir(self.xml_dir)) != size:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+            start = time.perf_counter()
+            generate_corpus(size, self.data_dir, seed=size, vocab=vocab)
+            print(f"  generated {size} documents in {time.perf_counter() - start:.1f} s", flush=True)
+        self.cache_dir = self.data_dir / "cache"
+        if not (self.cache_dir / RENDER_CACHE_FILE).exists():
+            # A cache from before renderings were kept; parse again so ingest_rerender has them
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        corpus = Corpus(self.xml_dir, self.cache_dir, workers=workers)
+        corpus.refresh()
+        self.records = corpus.records()
+        self.snapshot_path = self.data_dir / SNAPSHOT_FILE
+        # Rebuilt when missing or written for another record format
+        if load_snapshot(self.snapshot_path, self.data_dir) is None:
+            build_snapshot(self.data_dir, self.snapshot_path, workers)
+        self.biblio_refs = load_bibliography(DATA_DIR / "bibliography.xml")
+        self.authorities = load_authorities(DATA_DIR / "authority")
+        start = time.perf_counter()
+        self.index = SearchIndex(lambda entries: format_bibl_entries(entries, self.biblio_refs))
+        self.index.update({record.name: record for record in self.records}, ())
+        self.index_build_seconds = time.perf_counter() - start
+        self.facets = record_facets(self.records)
+        start = time.perf_counter()
+        self.concordance = ConcordanceIndex()
+        self.concordance.update({record.name: record for record in self.records}, ())
+        self.concordance_build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        self.elements = ElementIndex()
+        self.elements.update({record.name: record for record in self.records}, ())
+        self.elements_build_seconds = time.perf_counter() - start
+        self.long_edition, self.nested_edition, self.nesting_depth = self.long_editions()
+        self.place_json = {}
+        for source, file_name in PLACE_SOURCES:
+            with open(DATA_DIR / "authority" / file_name, encoding="utf-8") as f:
+                self.place_json[source] = json.load(f)
+
+    def long_editions(self):
+        """One edition div with the contents of every edition/textpart div, one with them nested, and its depth."""
+        flat = ET.Element(f"{TEI}div", type="edition")
+        nested = ET.Element(f"{TEI}div", type="edition")
+        parent = nested
+        depth = 0
+        for name in sorted(os.listdir(self.xml_dir)):
+            body = ET.parse(self.xml_dir / name).getroot().find(f"{TEI}text/{TEI}body")
+            for div in body.findall(f"{TEI}div"):
+                if div.get("type") in ("edition", "textpart"):
+                    flat.extend(div)
+                    supplied = ET.SubElement(parent, f"{TEI}supplied", reason="lost")
+                    supplied.extend(div)
+                    parent = supplied
+                    depth += 1
+        return flat, nested, depth
+
+    def scratch_dir(self):
+        return Path(tempfile.mkdtemp(dir=self.data_dir, prefix="scratch-"))
+
+    # --- stages: each returns the number of items processed and optional extra metrics ---
+    def ingest_cold(self):
+        scratch = self.scratch_dir()
+        try:
+            report = Corpus(self.xml_dir, scratch, workers=self.workers).refresh()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return report.parsed, {"workers": report.workers}
+
+    def ingest_warm(self):
+        corpus = Corpus(self.xml_dir, self.cache_dir, workers=self.workers)
+        report = corpus.refresh()
+        return len(corpus.by_name), {"parsed": report.parsed}
+
+    def ingest_rerender(self):
+        scratch = self.scratch_dir()
+        try:
+            shutil.copy(self.cache_dir / RENDER_CACHE_FILE, scratch / RENDER_CACHE_FILE)
+            report = Corpus(self.xml_dir, scratch, workers=self.workers).refresh()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return report.parsed, {"workers": report.workers}
+
+    def snapshot_load(self):
+        scratch = self.scratch_dir()
+        try:
+            snapshot = load_snapshot(self.snapshot_path, self.data_dir)
+            corpus = Corpus(self.xml_dir, scratch, workers=self.workers)
+            corpus.seed(snapshot.corpus_entries())
+            report = corpus.refresh()
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return len(corpus.by_name), {"parsed": report.parsed}
+
+    def leiden_render(self):
+        render_seconds = 0.0
+        divs = 0
+        for name in sorted(os.listdir(self.xml_dir)):
+            root = ET.parse(self.xml_dir / name).getroot()
+            body = root.find(f"{TEI}text/{TEI}body")
+            for div in body.findall(f"{TEI}div"):
+                if div.get("type") in ("edition", "textpart"):
+                    start = time.perf_counter()
+                    format_leiden_text(div)
+                    render_seconds += time.perf_counter() - start
+                    divs += 1
+        return divs, {"render_seconds": round(render_seconds, 6)}
+
+    def leiden_long(self):
+        format_leiden_text(self.long_edition)
+        start = time.perf_counter()
+        format_leiden_text(self.nested_edition)
+        nested_seconds = time.perf_counter() - start
+        elements = sum(1 for _ in self.long_edition.iter()) - 1
+        return elements, {"nested_seconds": round(nested_seconds, 6), "nesting_depth": self.nesting_depth}
+
+    def leiden_targets(self):
+        divs = []
+        for name in sorted(os.listdir(self.xml_dir)):
+            body = ET.parse(self.xml_dir / name).getroot().find(f"{TEI}text/{TEI}body")
+            divs.extend(div for div in body.findall(f"{TEI}div") if div.get("type") in ("edition", "textpart"))
+        start = time.perf_counter()
+        for div in divs:
+            render(div)
+        one_walk = time.perf_counter() - start
+        start = time.perf_counter()
+        for div in divs:
+            for target in TARGETS:
+                render(div, (target,))
+        separate_seconds = time.perf_counter() - start
+        return len(divs), {"render_seconds": round(one_walk, 6), "separate_seconds": round(separate_seconds, 6)}
+
+    def search(self):
+        def format_bibliography(entries):
+            return format_bibl_entries(entries, self.biblio_refs)
+
+        hits = 0
+        for term, field in SEARCH_QUERIES:
+            hits += len(scan_records(self.records, term, field, format_bibliography))
+        return len(self.records) * len(SEARCH_QUERIES), {"hits": hits}
+
+    def search_index(self):
+        hits = 0
+        for term, field in SEARCH_QUERIES:
+            results = self.index.search(term, field)
+            results.page(1, 25)
+            hits += len(results)
+        return len(SEARCH_QUERIES), {"hits": hits, "build_seconds": round(self.index_build_seconds, 6)}
+
+    def search_fuzzy(self):
+        hits = 0
+        for term in FUZZY_QUERIES:
+            hits += len(self.index.fuzzy_search(term))
+        return len(FUZZY_QUERIES), {"hits": hits}
+
+    def concordance_lines(self):
+        lines = 0
+        for form in CONCORDANCE_FORMS:
+            lines += len(self.concordance.lines(form, sort="left"))
+        return len(CONCORDANCE_FORMS), {"lines": lines,
+                                        "build_seconds": round(self.concordance_build_seconds, 6)}
+
+    def structure_query(self):
+        hits = 0
+        for query in STRUCTURE_QUERIES:
+            results = self.elements.query(query)
+            results.page(1, 25)
+            hits += len(results)
+        return len(STRUCTURE_QUERIES), {"hits": hits, "build_seconds": round(self.elements_build_seconds, 6)}
+
+    def facet_filter(self):
+        # Every single value of each facet, then every pair of values across two facets
+        selections = [{facet: [value]} for facet, values in self.facets.bits.items() for value in values]
+        selections += [dict(a, **b) for a in selections[:20] for b in selections[-20:]
+                       if a.keys() != b.keys()]
+        matches = 0
+        for selection in selections:
+            matches += self.facets.match(selection).bit_count()
+            self.facets.counts(selection)
+        return len(selections), {"matches": matches}
+
+    def referenced_places(self):
+        points = 0
+        for record in self.records:
+            for source, json_obj in self.place_json.items():
+                map_points, _ = map_view.extract_referenced_places(json_obj, source, record.refs, record.title)
+                points += len(map_points)
+        return len(self.records) * len(self.place_json), {"map_points": points}
+
+    def network_build(self):
+        rows = [network_record(record, self.authorities) for record in self.records]
+        graph = network_graph(network_frame(rows))
+        return len(rows), {"nodes": graph.number_of_nodes(), "edges": graph.number_of_edges()}
+
+    STAGES = ("ingest_cold", "ingest_warm", "ingest_rerender", "snapshot_load", "leiden_render", "leiden_long",
+              "leiden_targets", "search", "search_index", "search_fuzzy", "concordance_lines", "structure_query",
+              "facet_filter", "referenced_places", "network_build")
+
+
+def run_stage(workload, stage, memory=True):
+    """Time one stage, then (optionally) rerun it under tracemalloc for its peak allocation."""
+    run = getattr(workload, stage)
+    start = time.perf_counter()
+    items, extra = run()
+    seconds = time.perf_counter() - start
+    result = {
+        "seconds": round(seconds, 6),
+        "items": items,
+        "per_item_us": round(seconds / items * 1e6, 3) if items else None,
+        **extra,
+    }
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(report, baseline, threshold):
+    """Print current/baseline timing ratios; return the (size, stage) pairs over threshold."""
+    regressions = []
+    for size, stages in report["results"].items():
+        for stage, result in stages.items():
+            before = baseline.get("results", {}).get(size, {}).get(stage)
+            if not before or not before.get("seconds"):
+                continue
+            ratio = result["seconds"] / before["seconds"]
+            flag = "  <-- slower" if ratio > threshold else ""
+            print(f"{size:>8} {stage:<18} {before['seconds']:10.3f} s -> {result['seconds']:10.3f} s  x{ratio:.2f}{flag}")
+            if ratio > threshold:
+                regressions.append((size, stage))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the corpus scaling benchmarks.")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma-separated corpus sizes (e.g. 1000,10000,100000)")
+    parser.add_argument("--stages", default=",".join(Workload.STAGES),
+                        help="comma-separated subset of: " + ", ".join(Workload.STAGES))
+    parser.add_argument("--work-dir", default=str(Path(tempfile.gettempdir()) / "bashtina-bench"),
+                        help="where generated corpora are kept between runs")
+    parser.add_argument("--workers", type=int, help="ingestion worker processes (default: all cores)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="earlier report to compare timings against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args(argv)
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(Workload.STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+
+    vocab = Vocabulary(DATA_DIR)
+    report = {"environment": environment(), "results": {}}
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"corpus of {size} documents", flush=True)
+        workload = Workload(size, args.work_dir, args.workers, vocab)
+        results = report["results"][str(size)] = {}
+        for stage in stages:
+            results[stage] = run_stage(workload, stage, memory=not args.no_memory)
+            peak = results[stage].get("peak_mb")
+            print(f"  {stage:<18} {results[stage]['seconds']:10.3f} s"
+                  + (f"  peak {peak:9.1f} MB" if peak is not None else ""), flush=True)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report["environment"]["max_rss_mb"] = round(usage.ru_maxrss / 1024, 1)
+    report["environment"]["max_rss_children_mb"] = round(children.ru_maxrss / 1024, 1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
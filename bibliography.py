@@ -61,3 +61,30 @@ def load_bibliography(biblio_xml_path):
         refs[xmlid] = ' '.join(parts).replace(' .', '.').strip()
 
     return refs
+
+
+def format_bibl_entries(entries, biblio_refs):
+    """
+    For each (bibliography id, page) pair taken from a <bibl>, lookup the full
+    reference in biblio_refs; then, if the element had inner text (the page),
+    append ", p.<page>".
+    Otherwise fall back to plain <bibl> text.
+    """
+    texts = []
+    for ref_id, page in entries:
+        # if it's a bib reference, look it up
+        entry = biblio_refs.get(ref_id) if ref_id else None
+
+        # if we found a lookup entry, use it
+        if entry:
+            # append page if present
+            if page:
+                texts.append(f"{entry}, p.{page}")
+            else:
+                texts.append(entry)
+        else:
+            # fallback: just output whatever is inside <bibl>
+            if page:
+                texts.append(page)
+
+    return "\n".join(texts)
@@ -0,0 +1,158 @@
+"""
+Keyword-in-context (KWIC) concordances of the editions and translations.
+
+ConcordanceIndex keeps, for every normalised word form, the position of each of
+its occurrences in the text as it is shown (the rendered Leiden edition stored
+in the record, or the translation), so concordance lines are cut straight out of
+the stored texts without rendering or scanning any document again.
+"""
+import csv
+import io
+import threading
+from array import array
+
+from normalize import normalize_edition, normalize_offsets
+from search import EDITION, TOKEN_RE
+
+CONCORDANCE_SECTIONS = (EDITION, "Translation")
+CONTEXT_WIDTH = 40
+SORT_ORDERS = ("document", "left", "right")
+CSV_COLUMNS = ("file_name", "section", "left", "keyword", "right")
+
+
+def _context(text, start, end, width):
+    """Whitespace-collapsed text before start and after end, at most width characters each."""
+    left = " ".join(text[max(0, start - 2 * width):start].split())[-width:]
+    right = " ".join(text[end:end + 2 * width].split())[:width]
+    return left, right
+
+
+class ConcordanceIndex:
+    """
+    Positional index of the concordance sections of every record.
+
+    Each section of a record is a document, numbered in the order it was added.
+    postings maps a word form to a flat array of (document, start, end) triples,
+    start and end being offsets into the document's original text. Removed
+    documents are only marked as such; their triples are dropped in bulk once
+    they make up half of the index. attach() follows a Corpus like SearchIndex.
+    """
+
+    def __init__(self):
+        self.postings = {}   # word form -> array of (document, start, end) triples
+        self.documents = []  # document number -> (name, section, text), None once removed
+        self.numbers = {}    # name -> its document numbers
+        self.removed = 0
+        self.lock = threading.RLock()
+
+    def attach(self, corpus):
+        """Index all records of the corpus and follow its changes."""
+        with corpus.lock:
+            self.update(corpus.by_name, ())
+            corpus.subscribe(lambda changed, removed: self.update(
+                {name: corpus.by_name[name] for name in changed}, removed))
+        return self
+
+    @staticmethod
+    def section_texts(record):
+        return {EDITION: record.leiden_text, "Translation": record.translation}
+
+    def update(self, records, removed):
+        """(Re)index the given {name: record} and drop the removed names."""
+        with self.lock:
+            for name in list(records) + list(removed):
+                self._remove(name)
+            for name, record in records.items():
+                self._add(name, record)
+            if self.removed * 2 > len(self.documents):
+                self._compact()
+
+    def _add(self, name, record):
+        numbers = self.numbers[name] = []
+        for section, text in self.section_texts(record).items():
+            if not text:
+                continue
+            number = len(self.documents)
+            self.documents.append((name, section, text))
+            numbers.append(number)
+            key, offsets = normalize_offsets(text, section == EDITION)
+            for match in TOKEN_RE.finditer(key):
+                positions = self.postings.get(match.group())
+                if positions is None:
+                    positions = self.postings[match.group()] = array('I')
+                positions.extend((number, offsets[match.start()], offsets[match.end() - 1] + 1))
+
+    def _remove(self, name):
+        for number in self.numbers.pop(name, ()):
+            self.documents[number] = None
+            self.removed += 1
+
+    def _compact(self):
+        """Renumber the live documents and drop the triples of removed ones."""
+        renumbered = {}
+        documents = []
+        for number, document in enumerate(self.documents):
+            if document is not None:
+                renumbered[number] = len(documents)
+                documents.append(document)
+        postings = {}
+        for form, positions in self.postings.items():
+            kept = array('I')
+            for i in range(0, len(positions), 3):
+                number = renumbered.get(positions[i])
+                if number is not None:
+                    kept.extend((number, positions[i + 1], positions[i + 2]))
+            if kept:
+                postings[form] = kept
+        self.numbers = {name: [renumbered[n] for n in numbers] for name, numbers in self.numbers.items()}
+        self.documents = documents
+        self.postings = postings
+        self.removed = 0
+
+    def lines(self, form, sections=CONCORDANCE_SECTIONS, width=CONTEXT_WIDTH, sort="document",
+              partial=False):
+        """
+        Concordance lines of a word form as dicts with file_name, section, left,
+        keyword and right. The form is normalised like the search keys; with
+        partial, every word containing it is included. sort is "document"
+        (file and position), "left" (by the words before, nearest first)
+        or "right" (by the words after).
+        """
+        words = TOKEN_RE.findall(normalize_edition(form)[0])
+        if len(words) != 1:
+            raise ValueError("A concordance is built for a single word form.")
+        word = words[0]
+        sections = set(sections)
+
+        with self.lock:
+            forms = [token for token in self.postings if word in token] if partial else [word]
+            lines = []
+            for token in forms:
+                positions = self.postings.get(token, ())
+                for i in range(0, len(positions), 3):
+                    document = self.documents[positions[i]]
+                    if document is None or document[1] not in sections:
+                        continue
+                    name, section, text = document
+                    start, end = positions[i + 1], positions[i + 2]
+                    left, right = _context(text, start, end, width)
+                    lines.append({'file_name': name, 'section': section, 'left': left,
+                                  'keyword': text[start:end], 'right': right, 'offset': start})
+
+        if sort == "left":
+            lines.sort(key=lambda line: (line['left'].casefold().split()[::-1], line['keyword']))
+        elif sort == "right":
+            lines.sort(key=lambda line: (line['right'].casefold(), line['keyword']))
+        else:
+            order = {section: i for i, section in enumerate(CONCORDANCE_SECTIONS)}
+            lines.sort(key=lambda line: (line['file_name'], order[line['section']], line['offset']))
+        return lines
+
+
+def to_csv(lines):
+    """The concordance lines as CSV text."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(lines)
+    return buffer.getvalue()
@@ -0,0 +1,452 @@
+"""
+Corpus loading helpers: a persistent on-disk cache of parsed TEI files, a
+process-pool ingestion engine for the files that have to be parsed, and an
+in-memory corpus that a polling watcher keeps in step with the data folder.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from leiden import RENDER_VERSION
+from records import MonumentRecord, extract_record
+
+# Bump whenever the shape of the cached entries changes. Caches are also
+# discarded whenever the MonumentRecord slots differ from those they were written with
+CACHE_VERSION = 5
+RECORD_FIELDS = MonumentRecord.__slots__
+CACHE_FILE = "corpus_cache.pkl"
+RENDER_CACHE_FILE = "render_cache.sqlite"
+
+# Below this many files the cost of starting worker processes outweighs the gain
+PARALLEL_THRESHOLD = 32
+
+
+def file_signature(path) -> tuple:
+    """Return the cheap (mtime_ns, size) freshness key of a file."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def content_hash(data: bytes) -> str:
+    """Return the hex digest used to recognise unchanged file contents."""
+    return hashlib.sha1(data).hexdigest()
+
+
+class CorpusCache:
+    """
+    Persistent store of parsed corpus entries keyed by file name.
+
+    Every entry remembers the mtime/size and content hash of its source file.
+    Files whose mtime and size are unchanged are served without being read,
+    and files that were touched but not modified are only re-hashed.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = Path(cache_dir) / CACHE_FILE
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """Read the cache file, silently starting empty if it is missing or unusable."""
+        try:
+            with open(self.path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get('version') == CACHE_VERSION and payload.get('fields') == RECORD_FIELDS:
+                self.entries = payload['entries']
+        except Exception:
+            self.entries = {}
+        return self
+
+    def save(self):
+        """Atomically write the cache file if anything changed since it was loaded."""
+        if not self.dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': CACHE_VERSION, 'fields': RECORD_FIELDS, 'entries': self.entries}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError:
+            # The cache is only an optimisation; a read-only disk must not break loading
+            pass
+
+    def get(self, name, signature):
+        """Return the cached entry for name if its mtime/size still match, else None."""
+        cached = self.entries.get(name)
+        if cached and cached['signature'] == signature:
+            return cached['entry']
+        return None
+
+    def get_by_hash(self, name, signature, digest):
+        """Return the cached entry for name if its content is unchanged, refreshing its signature."""
+        cached = self.entries.get(name)
+        if cached and cached['hash'] == digest:
+            if cached['signature'] != signature:
+                cached['signature'] = signature
+                self.dirty = True
+            return cached['entry']
+        return None
+
+    def put(self, name, signature, digest, entry):
+        self.entries[name] = {'signature': signature, 'hash': digest, 'entry': entry}
+        self.dirty = True
+
+    def seed(self, name, signature, digest, entry):
+        """Add a precompiled entry (e.g. from a snapshot) unless the cache already has one."""
+        self.entries.setdefault(name, {'signature': signature, 'hash': digest, 'entry': entry})
+
+    def prune(self, names):
+        """Drop entries for files that no longer exist."""
+        for name in set(self.entries) - set(names):
+            del self.entries[name]
+            self.dirty = True
+
+
+class RenderCache:
+    """
+    Persistent Leiden renderings of body divs keyed by document content hash and div path.
+
+    Kept next to the corpus cache but versioned by the renderer (RENDER_VERSION)
+    rather than by the record format, so extracting unchanged documents again,
+    e.g. after a record format change or into a new cache folder, reuses their
+    renderings. It is a SQLite file so that the renderings of the files being
+    parsed are looked up without loading those of the whole corpus.
+    """
+
+    def __init__(self, cache_dir):
+        self.path = Path(cache_dir) / RENDER_CACHE_FILE
+        self.db = None
+
+    def open(self):
+        """Open (or create) the cache file; without a usable one nothing is found or stored."""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path)
+            if db.execute("PRAGMA user_version").fetchone()[0] != RENDER_VERSION:
+                db.execute("DROP TABLE IF EXISTS renders")
+                db.execute("CREATE TABLE renders (digest TEXT, path TEXT, raw TEXT, stripped TEXT, lines TEXT, "
+                           "PRIMARY KEY (digest, path))")
+                db.execute(f"PRAGMA user_version = {RENDER_VERSION}")
+            self.db = db
+        except (OSError, sqlite3.Error):
+            self.db = None
+        return self
+
+    def get(self, digest) -> dict:
+        """Return {div path: (raw, stripped, line spans)} of the document with this content hash."""
+        if self.db is not None:
+            try:
+                rows = self.db.execute("SELECT path, raw, stripped, lines FROM renders WHERE digest = ?",
+                                       (digest,))
+                return {path: (raw, stripped, tuple(map(tuple, json.loads(lines))))
+                        for path, raw, stripped, lines in rows}
+            except sqlite3.Error:
+                self.close()
+        return {}
+
+    def put(self, digest, renders):
+        if self.db is not None:
+            try:
+                self.db.executemany("INSERT OR REPLACE INTO renders VALUES (?, ?, ?, ?, ?)",
+                                    [(digest, path, raw, stripped, json.dumps(lines, ensure_ascii=False))
+                                     for path, (raw, stripped, lines) in renders.items()])
+            except sqlite3.Error:
+                self.close()
+
+    def prune(self, digests):
+        """Drop the renderings of documents whose content hash is not in digests."""
+        if self.db is not None:
+            try:
+                self.db.execute("CREATE TEMP TABLE IF NOT EXISTS keep (digest TEXT PRIMARY KEY)")
+                self.db.execute("DELETE FROM keep")
+                self.db.executemany("INSERT OR IGNORE INTO keep VALUES (?)", ((digest,) for digest in digests))
+                self.db.execute("DELETE FROM renders WHERE digest NOT IN (SELECT digest FROM keep)")
+            except sqlite3.Error:
+                self.close()
+
+    def close(self):
+        """Commit and close; the cache is only an optimisation, so its errors are ignored."""
+        if self.db is not None:
+            db, self.db = self.db, None
+            try:
+                db.commit()
+            except sqlite3.Error:
+                pass
+            db.close()
+
+
+class IngestReport:
+    """Outcome of an ingestion run: extracted records, per-file errors and per-file timings."""
+
+    def __init__(self):
+        self.records = {}
+        self.errors = {}
+        self.timings = {}
+        self.workers = 1
+        self.elapsed = 0.0
+
+    @property
+    def parsed(self) -> int:
+        """Number of files that were parsed, successfully or not."""
+        return len(self.timings)
+
+    def slowest(self, n=10) -> list:
+        """Return the n slowest files as (name, seconds) pairs."""
+        return sorted(self.timings.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def _ingest_one(extract, name, data, renders=None):
+    """Worker entry point; never raises so one bad file cannot abort the pool."""
+    start = time.perf_counter()
+    try:
+        if renders is None:
+            record, error = extract(name, data), None
+        else:
+            record, error = extract(name, data, renders=renders), None
+    except Exception as e:
+        record, error = None, str(e)
+    return name, record, error, time.perf_counter() - start, renders
+
+
+def ingest_files(items, extract, workers=None, render_cache=None) -> IngestReport:
+    """
+    Parse and extract (name, data) pairs, spreading the work over a process pool.
+
+    extract(name, data) must be a module-level function (or a partial of one) so it
+    can be sent to the workers, and must return a picklable record. Small batches
+    are handled in-process. With a RenderCache, extract is also passed the stored
+    renderings of each document as renders= (see extract_record) and the new ones
+    are stored.
+    """
+    items = list(items)
+    report = IngestReport()
+    if not items:
+        return report
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    job = partial(_ingest_one, extract)
+    names = [name for name, _ in items]
+    datas = [data for _, data in items]
+    digests = [content_hash(data) for data in datas] if render_cache is not None else None
+    renders = [render_cache.get(digest) for digest in digests] if digests else [None] * len(items)
+    stored = [len(known) if known is not None else 0 for known in renders]
+
+    if workers > 1 and len(items) >= PARALLEL_THRESHOLD:
+        report.workers = workers
+        chunksize = max(1, len(items) // (workers * 4))
+        # spawn keeps workers independent of the threads running in the parent server
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(job, names, datas, renders, chunksize=chunksize))
+    else:
+        results = [job(name, data, known) for name, data, known in zip(names, datas, renders)]
+
+    for i, (name, record, error, seconds, rendered) in enumerate(results):
+        report.timings[name] = seconds
+        if error is not None:
+            report.errors[name] = error
+        else:
+            report.records[name] = record
+            if digests and len(rendered) > stored[i]:
+                render_cache.put(digests[i], rendered)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def list_xml_files(folder_path) -> list:
+    """Return the names of the XML files in folder_path, sorted."""
+    return sorted(name for name in os.listdir(folder_path) if name.endswith('.xml'))
+
+
+class Corpus:
+    """
+    In-memory monument records of one XML folder, backed by the on-disk cache.
+
+    refresh() re-reads just the named files (or the whole folder) and patches the
+    records in place. Callables registered with subscribe() are then called with the
+    sets of changed and removed file names, so indexes built from the records can be
+    patched instead of rebuilt. ``version`` increases with every change.
+    """
+
+    def __init__(self, folder_path, cache_dir, extract=extract_record, workers=None):
+        self.folder_path = Path(folder_path)
+        self.extract = extract
+        self.workers = workers
+        self.cache = CorpusCache(cache_dir).load()
+        self.by_name = {}
+        self.signatures = {}
+        self.errors = {}
+        self.version = 0
+        self.last_report = IngestReport()
+        self.listeners = []
+        self.lock = threading.RLock()
+
+    def subscribe(self, listener):
+        """Register listener(changed, removed), called after every refresh that changed something."""
+        self.listeners.append(listener)
+
+    def seed(self, entries):
+        """
+        Offer precompiled {name: (signature, digest, record)} entries to the cache.
+        The next refresh() serves them like cached entries, so only files that changed
+        since they were compiled are parsed.
+        """
+        with self.lock:
+            for name, (signature, digest, record) in entries.items():
+                self.cache.seed(name, signature, digest, record)
+
+    def records(self) -> list:
+        """Return the current records in file-name order."""
+        with self.lock:
+            return [self.by_name[name] for name in sorted(self.by_name)]
+
+    def refresh(self, names=None) -> IngestReport:
+        """
+        Bring the records of the given file names (all files when None) up to date.
+
+        Only new or changed files are handed to the ingestion engine; the report covers
+        just those. Files that fail to parse are neither cached nor kept, and their
+        errors stay in ``errors`` until the file is fixed or removed.
+        """
+        with self.lock:
+            present = list_xml_files(self.folder_path)
+            present_set = set(present)
+            if names is None:
+                check = present
+                removed = set(self.by_name) - present_set
+            else:
+                check = [name for name in names if name in present_set]
+                removed = {name for name in names if name not in present_set}
+
+            changed = set()
+            pending = {}
+            for name in check:
+                file_path = self.folder_path / name
+                signature = file_signature(file_path)
+                entry = self.cache.get(name, signature)
+                if entry is None:
+                    data = file_path.read_bytes()
+                    digest = content_hash(data)
+                    entry = self.cache.get_by_hash(name, signature, digest)
+                    if entry is None:
+                        pending[name] = (signature, digest, data)
+                        continue
+                self.signatures[name] = signature
+                self.errors.pop(name, None)
+                if self.by_name.get(name) is not entry:
+                    self.by_name[name] = entry
+                    changed.add(name)
+
+            # Renderings are only looked up (and the file opened) when there is something to parse
+            render_cache = RenderCache(self.cache.path.parent).open() if pending else None
+            report = ingest_files(((name, data) for name, (_, _, data) in pending.items()),
+                                  self.extract, self.workers, render_cache)
+            for name, record in report.records.items():
+                signature, digest, _ = pending[name]
+                self.cache.put(name, signature, digest, record)
+                self.signatures[name] = signature
+                self.errors.pop(name, None)
+                self.by_name[name] = record
+                changed.add(name)
+            for name, error in report.errors.items():
+                self.signatures[name] = pending[name][0]
+                self.errors[name] = error
+                if self.by_name.pop(name, None) is not None:
+                    removed.add(name)
+
+            for name in removed:
+                self.signatures.pop(name, None)
+                self.errors.pop(name, None)
+                if self.by_name.pop(name, None) is None:
+                    removed.discard(name)
+
+            self.cache.prune(present)
+            self.cache.save()
+            if render_cache is not None:
+                render_cache.prune(cached['hash'] for cached in self.cache.entries.values())
+                render_cache.close()
+            if report.parsed:
+                self.last_report = report
+            if changed or removed:
+                self.version += 1
+                for listener in self.listeners:
+                    listener(changed, removed)
+            return report
+
+
+def _tree_signature(path):
+    """Freshness key of a file, or of every file directly inside a folder."""
+    path = Path(path)
+    if path.is_dir():
+        return tuple(sorted((child.name, file_signature(child)) for child in path.iterdir() if child.is_file()))
+    return file_signature(path) if path.exists() else None
+
+
+class CorpusWatcher(threading.Thread):
+    """
+    Background thread polling the corpus folder and other data files for changes.
+
+    Added, edited or deleted XML files are re-extracted into the corpus on their own.
+    A change to any of the other watched paths (files or folders) is passed to
+    on_change(path), so caches built from them can be dropped.
+    """
+
+    def __init__(self, corpus, watch_paths=(), on_change=None, interval=2.0):
+        super().__init__(name="corpus-watcher", daemon=True)
+        self.corpus = corpus
+        self.on_change = on_change
+        self.interval = interval
+        self.watched = {Path(path): _tree_signature(path) for path in watch_paths}
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except OSError:
+                # Files can disappear between listing and reading; the next poll catches up
+                continue
+
+    def poll(self):
+        """Check every watched path once and apply what changed."""
+        current = {name: file_signature(self.corpus.folder_path / name)
+                   for name in list_xml_files(self.corpus.folder_path)}
+        with self.corpus.lock:
+            known = dict(self.corpus.signatures)
+        touched = {name for name, signature in current.items() if known.get(name) != signature}
+        touched |= set(known) - set(current)
+        if touched:
+            self.corpus.refresh(touched)
+
+        for path, signature in self.watched.items():
+            new_signature = _tree_signature(path)
+            if new_signature != signature:
+                self.watched[path] = new_signature
+                if self.on_change is not None:
+                    self.on_change(path)
+
+
+def load_corpus(folder_path, cache_dir, extract=extract_record, workers=None):
+    """
+    Return (records, report) for every XML file in folder_path, records in file-name order.
+    See Corpus.refresh for what is parsed and reported.
+    """
+    corpus = Corpus(folder_path, cache_dir, extract, workers)
+    report = corpus.refresh()
+    return corpus.records(), report
@@ -0,0 +1,99 @@
+"""
+Line-addressed view of the edition of a record.
+
+The renderer notes where every <lb n="..."/> starts a line of the Leiden text
+and records keep the spans of these lines in the stored text
+(MonumentRecord.lines), so lines, apparatus entries and search hits are
+resolved against the text as it is shown without rendering it again:
+
+    lines = EditionLines(record)
+    lines.line("3")          # the line numbered 3 (of the first textpart having one)
+    lines.apparatus()        # [(loc, notes, line or None)] for side-by-side display
+    lines.at(120)            # the line holding offset 120 of record.leiden_text
+    lines.hits("царь")       # the lines holding a match
+"""
+from bisect import bisect_right
+
+from normalize import normalize_edition, normalize_offsets
+
+
+class Line:
+    """One numbered line: its textpart label, number and span in record.leiden_text."""
+
+    __slots__ = ('label', 'n', 'start', 'end', 'text')
+
+    def __init__(self, label, n, start, end, text):
+        self.label = label
+        self.n = n
+        self.start = start
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Line({self.label + '.' if self.label else ''}{self.n}: {self.text!r})"
+
+    @property
+    def number(self):
+        """The line number as written in the apparatus, prefixed with the textpart label."""
+        return f"{self.label}.{self.n}" if self.label else self.n
+
+
+class EditionLines:
+    """
+    The numbered lines of a record's edition, in order, with lookups by number
+    (by_number, keyed by n and by (label, n)) and by offset (the sorted starts).
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self.text = record.leiden_text
+        self.lines = []
+        self.by_number = {}
+        parts = record.edition or ()
+        labelled = not (len(parts) == 1 and not parts[0][0])
+        base = 0
+        for (label, part_text), spans in zip(parts, record.lines or ()):
+            if labelled:
+                base += len(label) + 2  # "label.\n", as in leiden_text
+            for n, start, end in spans:
+                line = Line(label, n, base + start, base + end, part_text[start:end].strip())
+                self.lines.append(line)
+                self.by_number.setdefault(n, line)
+                self.by_number.setdefault((label, n), line)
+            base += len(part_text) + 2  # "\n\n" between parts
+        self.starts = [line.start for line in self.lines]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def line(self, n, label=None):
+        """The line numbered n (in the textpart label if given), or None."""
+        return self.by_number.get(str(n) if label is None else (label, str(n)))
+
+    def at(self, offset):
+        """The line holding an offset of record.leiden_text, or None before the first line."""
+        i = bisect_right(self.starts, offset) - 1
+        return self.lines[i] if i >= 0 else None
+
+    def apparatus(self):
+        """(loc, notes, line) of every apparatus entry, line None where no line has that number."""
+        return [(loc, notes, self.by_number.get(loc) if loc else None)
+                for loc, notes in self.record.apparatus_entries or ()]
+
+    def hits(self, search_term):
+        """The lines holding a match of search_term (as searched in the edition), in order."""
+        query = normalize_edition(search_term)[0]
+        if not query or not self.lines:
+            return []
+        key, offsets = normalize_offsets(self.text, edition=True)
+        found = []
+        position = key.find(query)
+        while position >= 0:
+            line = self.at(offsets[position])
+            if line is not None and (not found or found[-1] is not line):
+                found.append(line)
+            position = key.find(query, position + 1)
+        return found
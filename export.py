@@ -0,0 +1,225 @@
+"""
+Streaming export of the rendered corpus for downstream tools.
+
+Every XML file of the data folder is parsed once and its edition rendered as
+Leiden text, HTML and a normalised search key in the same walk, together with
+the English translation, commentary and apparatus and the formatted
+bibliography. Documents are streamed through a pool of workers a few at a
+time and written as they come back, so memory does not grow with the corpus:
+
+    python export.py jsonl corpus.jsonl      # one JSON object per document
+    python export.py html exports/html       # one HTML page per document
+    python export.py text exports/text       # one plain text file per document
+
+With --resume, documents already written by an interrupted run are skipped: the
+lines of the JSONL file (a partly written last line is dropped), or the files
+of the output folder, which are only moved into place once complete.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
+from pathlib import Path
+
+from bibliography import format_bibl_entries, load_bibliography
+from corpus import PARALLEL_THRESHOLD, list_xml_files
+from records import extract_rendered
+
+BASE_DIR = Path(__file__).resolve().parent
+EXPORT_FORMATS = ("jsonl", "html", "text")
+EXPORT_TARGETS = ('html', 'search')
+# Documents handed to each worker before their results are written
+IN_FLIGHT_PER_WORKER = 4
+
+
+def export_document(path):
+    """
+    Worker entry point: (name, row, error) for one XML file, row holding the
+    rendered edition parts and the English sections. Never raises.
+    """
+    name = os.path.basename(path)
+    try:
+        with open(path, 'rb') as f:
+            record, outputs = extract_rendered(name, f.read(), EXPORT_TARGETS)
+    except Exception as e:
+        return name, None, str(e)
+    row = {
+        'file_name': name,
+        'id': record.id,
+        'title': record.title,
+        'date': record.date,
+        'origin': record.origin,
+        'edition': [{'label': label, 'leiden': text,
+                     'html': rendered.get('html', ''), 'normalized': rendered.get('search', '')}
+                    for (label, text), rendered in zip(record.edition, outputs)],
+        'translation': record.translation,
+        'commentary': record.commentary,
+        'apparatus': record.apparatus,
+        'bibliography': list(record.bibliography),
+    }
+    return name, row, None
+
+
+def export_rows(paths, workers=None):
+    """
+    Yield export_document() results for paths, in order. At most a few
+    documents per worker are in flight, so results are never queued up.
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < PARALLEL_THRESHOLD:
+        for path in paths:
+            yield export_document(path)
+        return
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for path in paths:
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+            pending.append(pool.submit(export_document, str(path)))
+        while pending:
+            yield pending.popleft().result()
+
+
+def format_row(row, bibliography):
+    """The row with its (bibliography id, page) pairs resolved to references."""
+    row['bibliography'] = [text for text in (format_bibl_entries([entry], bibliography)
+                                             for entry in row['bibliography']) if text]
+    return row
+
+
+def row_text(row):
+    """Plain text of a document: title, the Leiden edition, then the English sections."""
+    sections = [row['title'] or row['file_name']]
+    for part in row['edition']:
+        sections.append(f"{part['label']}.\n{part['leiden']}" if part['label'] else part['leiden'])
+    for heading, key in (("Translation", 'translation'), ("Commentary", 'commentary'),
+                         ("Apparatus", 'apparatus')):
+        if row[key]:
+            sections.append(f"{heading}\n{row[key]}")
+    if row['bibliography']:
+        sections.append("Bibliography\n" + "\n".join(row['bibliography']))
+    return "\n\n".join(sections) + "\n"
+
+
+def row_html(row):
+    """A standalone HTML page of a document, the edition in the html render target."""
+    title = escape(row['title'] or row['file_name'])
+    body = [f"<h1>{title}</h1>"]
+    for part in row['edition']:
+        if part['label']:
+            body.append(f"<h2>{escape(part['label'])}</h2>")
+        body.append(f'<div class="edition-text">{part["html"]}</div>')
+    for heading, key in (("Translation", 'translation'), ("Commentary", 'commentary'),
+                         ("Apparatus", 'apparatus')):
+        if row[key]:
+            body.append(f"<h2>{heading}</h2>\n<p>{escape(row[key]).replace(chr(10), '<br>')}</p>")
+    if row['bibliography']:
+        items = "".join(f"<li>{escape(text)}</li>" for text in row['bibliography'])
+        body.append(f"<h2>Bibliography</h2>\n<ul>{items}</ul>")
+    return (f'<!DOCTYPE html>\n<html lang="en">\n<head><meta charset="utf-8"><title>{title}</title></head>\n'
+            f'<body>\n' + "\n".join(body) + "\n</body>\n</html>\n")
+
+
+class JsonlWriter:
+    """Rows appended to one JSONL file, flushed line by line."""
+
+    def __init__(self, path, resume=False):
+        self.path = Path(path)
+        self.done = self._completed() if resume else set()
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _completed(self):
+        """File names already in the file; a partly written last line is cut off."""
+        done = set()
+        if not self.path.exists():
+            return done
+        with open(self.path, 'rb+') as f:
+            end = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    done.add(json.loads(line)['file_name'])
+                except (ValueError, KeyError):
+                    break
+                end += len(line)
+            f.truncate(end)
+        return done
+
+    def write(self, row):
+        self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class FolderWriter:
+    """One file per document, written beside its final name and then moved into place."""
+
+    def __init__(self, folder, suffix, format_row, resume=False):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+        self.format_row = format_row
+        self.done = ({path.stem + '.xml' for path in self.folder.glob(f'*{suffix}')}
+                     if resume else set())
+
+    def write(self, row):
+        target = self.folder / (Path(row['file_name']).stem + self.suffix)
+        partial = target.with_name(target.name + '.part')
+        partial.write_text(self.format_row(row), encoding='utf-8')
+        os.replace(partial, target)
+
+    def close(self):
+        pass
+
+
+def open_writer(export_format, output, resume=False):
+    if export_format == "jsonl":
+        return JsonlWriter(output, resume)
+    if export_format == "html":
+        return FolderWriter(output, '.html', row_html, resume)
+    return FolderWriter(output, '.txt', row_text, resume)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the rendered editions of the corpus.")
+    parser.add_argument('format', choices=EXPORT_FORMATS)
+    parser.add_argument('output', help="JSONL file, or folder for the html and text formats")
+    parser.add_argument('--data-dir', default=str(BASE_DIR / 'data'))
+    parser.add_argument('--workers', type=int, help="worker processes (default: all cores)")
+    parser.add_argument('--resume', action='store_true', help="skip documents an earlier run already wrote")
+    args = parser.parse_args(argv)
+
+    data_dir = Path(args.data_dir)
+    biblio_xml = data_dir / 'bibliography.xml'
+    bibliography = load_bibliography(str(biblio_xml)) if biblio_xml.exists() else {}
+
+    start = time.perf_counter()
+    writer = open_writer(args.format, args.output, args.resume)
+    names = [name for name in list_xml_files(data_dir / 'xmls') if name not in writer.done]
+    written = errors = 0
+    try:
+        for name, row, error in export_rows((data_dir / 'xmls' / name for name in names), args.workers):
+            if error is not None:
+                errors += 1
+                print(f"skipped {name}: {error}", file=sys.stderr)
+                continue
+            writer.write(format_row(row, bibliography))
+            written += 1
+    finally:
+        writer.close()
+    print(f"Exported {written} documents ({len(writer.done)} already done) in "
+          f"{time.perf_counter() - start:.2f} s to {args.output}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Faceted filtering with one precomputed bitset per facet value.
+
+Bitsets are plain Python ints, bit i standing for item i, so combining filters
+is a handful of bitwise ANDs and ORs over machine words and a count is
+int.bit_count(). Values within a facet are ORed, facets are ANDed.
+"""
+import re
+
+from records import record_year
+
+_ONES = re.compile("1")
+
+
+def _bitset(positions, size):
+    """Int with the given bit positions set, built in one pass."""
+    buffer = bytearray((size + 7) // 8)
+    for i in positions:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class FacetIndex:
+    """
+    Bitsets over a fixed list of items for every value of every facet.
+
+    keys identifies the items (e.g. record names or row positions) and columns
+    maps each facet to the sequence of its values, one per item; an item whose
+    value is None is left out of that facet.
+    """
+
+    def __init__(self, keys, columns):
+        self.keys = list(keys)
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.all = (1 << len(self.keys)) - 1
+        self.bits = {}
+        for facet, values in columns.items():
+            positions = {}
+            for i, value in enumerate(values):
+                if value is not None:
+                    positions.setdefault(value, []).append(i)
+            self.bits[facet] = {value: _bitset(items, len(self.keys))
+                                for value, items in sorted(positions.items(), key=lambda kv: str(kv[0]))}
+
+    def values(self, facet):
+        return list(self.bits[facet])
+
+    def match(self, selection, skip=None):
+        """
+        Bitset of the items matching selection, {facet: selected values}.
+
+        A facet that is missing from selection (or is skip) does not filter;
+        one with no selected values matches nothing.
+        """
+        bits = self.all
+        for facet, values in selection.items():
+            if facet == skip or values is None:
+                continue
+            facet_bits = 0
+            for value in values:
+                facet_bits |= self.bits[facet].get(value, 0)
+            bits &= facet_bits
+            if not bits:
+                break
+        return bits
+
+    def counts(self, selection):
+        """
+        {facet: {value: count}} of the items each value would add or keep: every
+        facet is counted against the other facets' filters, so the counts stay
+        meaningful for values that are not selected yet.
+        """
+        counts = {}
+        for facet, value_bits in self.bits.items():
+            others = self.match(selection, skip=facet)
+            counts[facet] = {value: (bits & others).bit_count() for value, bits in value_bits.items()}
+        return counts
+
+    def keys_of(self, bits):
+        """Keys of the items in bits, in item order."""
+        return [self.keys[m.start()] for m in _ONES.finditer(bin(bits)[:1:-1])]
+
+    def contains(self, bits, key):
+        position = self.positions.get(key)
+        return position is not None and bool(bits >> position & 1)
+
+
+def century(year):
+    """'13th century' for 1201-1300; 'Undated' without a year."""
+    if not year:
+        return "Undated"
+    number = (year - 1) // 100 + 1
+    suffix = "th" if 10 <= number % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix} century"
+
+
+# Facets of record_facets() whose values are kept in lower case
+LOWERCASE_FACETS = ("Type", "Material", "Category")
+
+
+def facet_value(facet, value):
+    """A value of a record_facets() facet written as the facet keeps it."""
+    return value.lower() if facet in LOWERCASE_FACETS and value else value
+
+
+def record_facets(records):
+    """Facets of the search tab over monument records, keyed by file name."""
+    return FacetIndex([record.name for record in records], {
+        "Type": [facet_value("Type", record.type) or None for record in records],
+        "Material": [facet_value("Material", record.material) or None for record in records],
+        "Category": [facet_value("Category", record.category) or None for record in records],
+        "Origin": [record.origin or None for record in records],
+        "Century": [century(record_year(record)) for record in records],
+    })
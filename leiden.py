@@ -0,0 +1,605 @@
+"""
+Leiden+ rendering of EpiDoc editions and plain-text extraction of the English sections.
+
+Rendering is driven by tables of rules per tag (and attribute value), one table
+per output target: plain Leiden+ text, HTML with a span per element, the
+normalised search key, and the Leiden text with the offset of every numbered
+line. render() produces any of them in a single walk.
+
+Kept free of Streamlit so rendering can run inside ingestion worker processes.
+"""
+from html import escape
+
+from normalize import drop_gap_markers, normalize_words
+
+# Bump whenever format_leiden_text renders any element differently (or the stored
+# renderings change shape); stored renderings of an older version are discarded
+RENDER_VERSION = 2
+
+# Define TEI XML namespace
+NS = {
+    'tei': 'http://www.tei-c.org/ns/1.0',
+    'xml': 'http://www.w3.org/XML/1998/namespace'
+}
+
+# Local names of the tags seen so far, by qualified tag
+_LOCAL_NAMES = {}
+
+
+def _local(name):
+    local = _LOCAL_NAMES.get(name)
+    if local is None:
+        local = _LOCAL_NAMES[name] = name.split('}')[-1]
+    return local
+
+
+###############################################################################
+# Rendering rules
+###############################################################################
+# The rendering of an element is a string (a leaf, whose content the rule renders
+# itself) or an (opening, closing) pair (a container, whose children are rendered
+# in between). The tail is always added by the walker. A rule is that rendering
+# itself when it is constant, a function of the element, or a ByAttribute.
+
+class ByAttribute:
+    """Rule dispatching on the value of one attribute, default for any other value."""
+
+    __slots__ = ('attribute', 'rules', 'default')
+
+    def __init__(self, attribute, rules, default):
+        self.attribute = attribute
+        self.rules = rules
+        self.default = default
+
+
+def apply_rule(rule, elem):
+    """The rendering of elem by rule."""
+    if rule.__class__ is ByAttribute:
+        rule = rule.rules.get(elem.get(rule.attribute), rule.default)
+    return rule(elem) if callable(rule) else rule
+
+
+_CONTAINER = ('', '')
+
+
+def _text_of(elem):
+    return elem.text or ''
+
+
+def _unclear(elem):
+    return ''.join(f'{ch}\u0323' for ch in (elem.text or ''))
+
+
+def _orig(elem):
+    return f'<span class="orig-text">{elem.text or ""}</span>'
+
+
+def _supplied_lost(elem):
+    return '[', f'{"?" if elem.get("cert") == "low" else ""}]'
+
+
+def _expan(elem):
+    # Handles multiple abbr–ex pairs
+    parts = []
+    for abbr_el, ex_el in zip(elem.findall('tei:abbr', NS), elem.findall('tei:ex', NS)):
+        abbr_text = abbr_el.text or ''
+        exp_text = ex_el.text or ''
+        # only add parentheses if there's actually expansion text
+        if exp_text:
+            suffix = '?' if ex_el.get('cert') == 'low' else ''
+            parts.append(f"{abbr_text}({exp_text}{suffix})")
+        else:
+            parts.append(abbr_text)
+    return ''.join(parts)
+
+
+def _gap(elem):
+    unit = elem.get('unit')
+    qty = elem.get('quantity') or ''
+    extent = elem.get('extent')
+    cert_marker = '?' if elem.get('cert') == 'low' else ''
+    at_least = elem.get('atLeast')
+    at_most = elem.get('atMost')
+    if unit == 'character':
+        if extent == 'unknown':
+            return '[.?]'
+        if at_least and at_most:
+            # Range gaps like atLeast="2" atMost="3"
+            return f'[{at_least}-{at_most}{cert_marker}]'
+        if at_least:
+            return f'[{at_least}+{cert_marker}]'
+        if at_most:
+            return f'[≤{at_most}{cert_marker}]'
+        if elem.get('precision') == 'low':
+            return f'[.{qty}]'
+        return '[' + '.' * int(qty or 0) + ']'
+    if unit == 'line':
+        if extent == 'unknown':
+            return '(Lines: ? non transcribed)'
+        return f'(Lines: {qty} non transcribed)'
+    return ''
+
+
+def _inner_text(elem):
+    return ''.join(elem.itertext())
+
+
+def _wrapped(before, after, content=_text_of):
+    return lambda elem: f'{before}{content(elem)}{after}'
+
+
+def _choice(elem):
+    corr = elem.find('tei:corr', NS)
+    sic = elem.find('tei:sic', NS)
+    reg = elem.find('tei:reg', NS)
+    orig = elem.find('tei:orig', NS)
+    if corr is not None and sic is not None:
+        return f'<{corr.text}|corr|{sic.text}>'
+    if reg is not None and orig is not None:
+        return f'<{orig.text}|reg|{reg.text}>'
+    return ''.join(elem.itertext())
+
+
+def _g_other(elem):
+    type_ = elem.get('type')
+    return f'*{type_}*' if type_ else ''
+
+
+def _note(elem):
+    note = elem.text or ''
+    return f'/*{note}*/' if note in ('!', 'sic', 'e.g.') else f'({note})'
+
+
+def _space(elem):
+    qty = elem.get('quantity')
+    unknown = elem.get('extent') == 'unknown'
+    unit = elem.get('unit')
+    if unit == 'character':
+        return 'vac.?' if unknown else f'vac.{qty}'
+    if unit == 'line':
+        return 'vac.?lin' if unknown else f'vac.{qty}lin'
+    return ''
+
+
+LEIDEN_RULES = {
+    # Line breaks, unless within a word
+    'lb': ByAttribute('break', {'no': ''}, '\n'),
+    # Text divisions; other divs are plain containers
+    'div': ByAttribute('type', {'textpart': lambda elem: (f'<D=.{elem.get("n") or ""} ', ' =D>')}, _CONTAINER),
+    'unclear': _unclear,
+    'orig': _orig,
+    'supplied': ByAttribute('reason', {
+        'lost': _supplied_lost,
+        'undefined': ('_[', ']_'),
+        'omitted': ('<', '>'),
+        'subaudible': ('(', ')'),
+    }, _CONTAINER),
+    'expan': _expan,
+    'gap': ByAttribute('reason', {'ellipsis': '...'}, _gap),
+    'del': ByAttribute('rend', {'erasure': _wrapped('〚', '〛', _inner_text)}, _inner_text),
+    'add': ByAttribute('place', {
+        'overstrike': _wrapped('《', '》'),
+        'above': _wrapped('`', '´'),
+        'below': _wrapped('/', '\\'),
+    }, _text_of),
+    'choice': _choice,
+    'hi': ByAttribute('rend', {
+        'apex': _wrapped('', '(΄)'),
+        'supraline': _wrapped('', '¯'),
+        'ligature': _wrapped('', '\u0361'),
+    }, _text_of),
+    'abbr': _text_of,
+    'ex': _text_of,
+    'num': _text_of,
+    'g': ByAttribute('type', {
+        'cross': '♱',    # EAST SYRIAC CROSS
+        'dipunct': '։',  # ARMENIAN FULL STOP (U+0589)
+        'dot': '⸱',      # WORD SEPARATOR MIDDLE DOT
+    }, _g_other),
+    'surplus': _wrapped('{', '}'),
+    'note': _note,
+    'space': _space,
+    'w': _CONTAINER,
+}
+
+
+# Opening tags of the HTML spans, by tag and attributes
+_HTML_OPENINGS = {}
+
+
+def _html_opening(tag, elem):
+    key = (tag, *elem.attrib.items())
+    opening = _HTML_OPENINGS.get(key)
+    if opening is None:
+        attributes = ''.join(f' data-{_local(name)}="{escape(value)}"' for name, value in elem.attrib.items())
+        opening = _HTML_OPENINGS[key] = f'<span class="{tag}"{attributes}>'
+    return opening
+
+
+def _escape(text):
+    return escape(text, False) if '&' in text or '<' in text or '>' in text else text
+
+
+def _html_rule(tag, rule):
+    """
+    HTML rule from a Leiden rule: its escaped output in a span classed by tag,
+    carrying the attributes. Its wrap() makes the span from a Leiden rendering
+    already at hand, so rendering both targets applies the Leiden rule once.
+    """
+    def wrap(elem, rendered):
+        if rendered.__class__ is tuple:
+            return _html_opening(tag, elem) + _escape(rendered[0]), _escape(rendered[1]) + '</span>'
+        return f'{_html_opening(tag, elem)}{_escape(rendered)}</span>' if rendered else ''
+
+    def html_rule(elem):
+        return wrap(elem, apply_rule(rule, elem))
+
+    html_rule.source = rule
+    html_rule.wrap = wrap
+    return html_rule
+
+
+HTML_RULES = {tag: _html_rule(tag, rule) for tag, rule in LEIDEN_RULES.items()}
+HTML_RULES.update({
+    'lb': ByAttribute('break', {'no': ''}, '<br>'),
+    'orig': lambda elem: f'<span class="orig-text">{_escape(elem.text or "")}</span>',
+})
+
+
+def _search_choice(elem):
+    corr = elem.find('tei:corr', NS)
+    sic = elem.find('tei:sic', NS)
+    reg = elem.find('tei:reg', NS)
+    orig = elem.find('tei:orig', NS)
+    if corr is not None and sic is not None:
+        return f'{corr.text} {sic.text}'
+    if reg is not None and orig is not None:
+        return f'{orig.text} {reg.text}'
+    return ''.join(elem.itertext())
+
+
+def _search_expan(elem):
+    return ''.join((abbr_el.text or '') + (ex_el.text or '')
+                   for abbr_el, ex_el in zip(elem.findall('tei:abbr', NS), elem.findall('tei:ex', NS)))
+
+
+# The words as the search keys see them (see normalize_edition): expansions read
+# in, sigla, gaps and markup left out, word separators as spaces
+SEARCH_RULES = {
+    'lb': LEIDEN_RULES['lb'],
+    'div': ByAttribute('type', {'textpart': (' ', ' ')}, _CONTAINER),
+    'unclear': _text_of,
+    'orig': _wrapped(' ', ' '),
+    'supplied': _CONTAINER,
+    'expan': _search_expan,
+    'gap': ByAttribute('reason', {'ellipsis': '...'}, lambda elem: drop_gap_markers(_gap(elem))),
+    'del': _inner_text,
+    'add': _text_of,
+    'choice': _search_choice,
+    'hi': _text_of,
+    'abbr': _text_of,
+    'ex': _text_of,
+    'num': _text_of,
+    'g': LEIDEN_RULES['g'],
+    'surplus': _text_of,
+    'note': _text_of,
+    'space': lambda elem: drop_gap_markers(_space(elem)),
+    'w': _CONTAINER,
+}
+
+
+# Every <lb> writes its n between two NULs, which XML text cannot contain; the
+# lines target removes them again and returns where each line starts
+_LINE_MARK = '\x00'
+
+
+def _line_break(elem):
+    return f"{'' if elem.get('break') == 'no' else chr(10)}{_LINE_MARK}{elem.get('n', '')}{_LINE_MARK}"
+
+
+def _line_starts(text):
+    """The Leiden text without line marks, and the (n, offset) of every line start in it."""
+    pieces = text.split(_LINE_MARK)
+    starts = []
+    offset = len(pieces[0])
+    for i in range(1, len(pieces) - 1, 2):
+        starts.append((pieces[i], offset))
+        offset += len(pieces[i + 1])
+    return ''.join(pieces[::2]), tuple(starts)
+
+
+LINE_RULES = dict(LEIDEN_RULES, lb=_line_break)
+
+
+class Target:
+    """
+    One output of the renderer: the rule of every tag (unknown tags are plain
+    containers), how text and tails are written, and how the joined output is
+    finished.
+    """
+
+    def __init__(self, name, rules, escape_text=None, finish=None):
+        self.name = name
+        self.rules = rules
+        self.escape_text = escape_text
+        self.finish = finish
+
+
+TARGETS = {
+    'leiden': Target('leiden', LEIDEN_RULES),
+    'html': Target('html', HTML_RULES, escape_text=_escape),
+    'search': Target('search', SEARCH_RULES, finish=normalize_words),
+    'lines': Target('lines', LINE_RULES, finish=_line_starts),
+}
+
+
+def render(elem, targets=tuple(TARGETS)):
+    """
+    Render the content of elem for every named target in one walk over the tree;
+    return {target name: output}.
+
+    The tree is walked with an explicit stack of child iterators and every output
+    is appended to a list joined once at the end, so rendering is linear in the
+    size of the edition and deep nesting cannot hit the recursion limit. A
+    container writes its opening, its children are pushed, and its closing and
+    tail are written when they run out. All targets agree on which elements are
+    containers, so they share the walk.
+    """
+    if len(targets) == 1:
+        target = TARGETS[targets[0]]
+        return {target.name: _render_one(elem, target)}
+
+    targets = [TARGETS[name] for name in targets]
+    rules = _combined_rules(tuple(target.name for target in targets))
+    outs = [[] for _ in targets]
+    adds = [out.append for out in outs]
+    # (append, escape or None) per target, for text and tails
+    writers = [(out.append, target.escape_text) for out, target in zip(outs, targets)]
+
+    def add_text(text):
+        for add, escape_text in writers:
+            add(escape_text(text) if escape_text else text)
+
+    if elem.text:
+        add_text(elem.text)
+    stack = [iter(elem)]
+    closings = [[''] * len(targets)]
+    containers = rules[None]
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            for add, closing in zip(adds, closings.pop()):
+                add(closing)
+            continue
+        rule = rules.get(_LOCAL_NAMES.get(child.tag) or _local(child.tag), containers)
+        if rule.__class__ is ByAttribute:
+            rule = rule.rules.get(child.get(rule.attribute), rule.default)
+        rendered = rule if rule.__class__ is tuple else rule(child)
+        if rendered[0].__class__ is tuple:
+            # Descend; the closings and the tail follow the children
+            for add, (opening, _) in zip(adds, rendered):
+                add(opening)
+            if child.text:
+                add_text(child.text)
+            stack.append(iter(child))
+            tail = child.tail
+            if tail:
+                closings.append([closing + (escape_text(tail) if escape_text else tail)
+                                 for (_, closing), (_, escape_text) in zip(rendered, writers)])
+            else:
+                closings.append([closing for _, closing in rendered])
+            continue
+        for add, output in zip(adds, rendered):
+            add(output)
+        if child.tail:
+            add_text(child.tail)
+
+    results = {}
+    for target, out in zip(targets, outs):
+        text = ''.join(out)
+        results[target.name] = target.finish(text) if target.finish else text
+    return results
+
+
+def _combine(rules):
+    """
+    One rule giving the renderings of several rules as a sequence: a constant
+    tuple where they all are, dispatching once where they depend on the same
+    attribute.
+    """
+    if not any(callable(rule) or rule.__class__ is ByAttribute for rule in rules):
+        return tuple(rules)
+    attributes = {rule.attribute for rule in rules if rule.__class__ is ByAttribute}
+    if len(attributes) == 1 and all(rule.__class__ is ByAttribute or not callable(rule) for rule in rules):
+        values = set().union(*(rule.rules for rule in rules if rule.__class__ is ByAttribute))
+        by_value = {value: [rule.rules.get(value, rule.default) if rule.__class__ is ByAttribute else rule
+                            for rule in rules] for value in values}
+        defaults = [rule.default if rule.__class__ is ByAttribute else rule for rule in rules]
+        combined = {value: _combine(value_rules) for value, value_rules in by_value.items()}
+        default = _combine(defaults)
+        if not any(callable(rule) for rule in (default, *combined.values())):
+            return ByAttribute(attributes.pop(), combined, default)
+    # Rules made from the rendering of an earlier one (see _html_rule) reuse it
+    plan = []
+    for i, rule in enumerate(rules):
+        source = getattr(rule, 'source', None)
+        if source is not None and source in rules[:i]:
+            plan.append((rules.index(source), rule.wrap))
+        else:
+            plan.append((None, rule))
+
+    def combined(elem):
+        rendered = []
+        for source, rule in plan:
+            rendered.append(apply_rule(rule, elem) if source is None else rule(elem, rendered[source]))
+        return rendered
+    return combined
+
+
+_COMBINED_RULES = {}
+
+
+def _combined_rules(names):
+    """The rules of the named targets combined per tag; None gives the rule of unknown tags."""
+    combined = _COMBINED_RULES.get(names)
+    if combined is None:
+        tables = [TARGETS[name].rules for name in names]
+        tags = set().union(*tables)
+        combined = {tag: _combine([table.get(tag, _CONTAINER) for table in tables]) for tag in tags}
+        combined[None] = (_CONTAINER,) * len(names)
+        _COMBINED_RULES[names] = combined
+    return combined
+
+
+def _unchanged(text):
+    return text
+
+
+def _render_one(elem, target):
+    """render() for a single target, with the rule lookup inlined."""
+    rules = target.rules
+    escape_text = target.escape_text or _unchanged
+    out = []
+    add = out.append
+    if elem.text:
+        add(escape_text(elem.text))
+    stack = [iter(elem)]
+    closings = ['']
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            add(closings.pop())
+            continue
+        tag = _LOCAL_NAMES.get(child.tag) or _local(child.tag)
+        rule = rules.get(tag, _CONTAINER)
+        if rule.__class__ is ByAttribute:
+            rule = rule.rules.get(child.get(rule.attribute), rule.default)
+        rendered = rule if rule.__class__ is str or rule.__class__ is tuple else rule(child)
+        if rendered.__class__ is tuple:
+            add(rendered[0])
+            if child.text:
+                add(escape_text(child.text))
+            stack.append(iter(child))
+            closings.append(rendered[1] + escape_text(child.tail) if child.tail else rendered[1])
+            continue
+        add(rendered)
+        if child.tail:
+            add(escape_text(child.tail))
+    text = ''.join(out)
+    return target.finish(text) if target.finish else text
+
+
+def format_leiden_text(elem):
+    """
+    Plain text version of the Old Church Slavonic text (edition) with Leiden+
+    style formatting, covering full EpiDoc cases (see render()).
+    """
+    return render(elem, ('leiden',))['leiden']
+
+
+def extract_english_text(div, child_tag):
+    """
+    Extract and join text from all elements with the given child_tag that have xml:lang="en".
+    This function works for translation and commentary sections.
+    """
+    texts = []
+    if div is None:
+        return ""
+    for elem in div.findall(f".//tei:{child_tag}", NS):
+        if elem.attrib.get("{http://www.w3.org/XML/1998/namespace}lang") == "en":
+            # First try to get text from a note element if it exists
+            note = elem.find("tei:note", NS)
+            if note is not None and note.text:
+                texts.append(note.text.strip())
+            # If no note element or no text in note, try the element's direct text
+            elif elem.text:
+                texts.append(elem.text.strip())
+    return "\n".join(texts)
+
+def extract_apparatus_entries(div):
+    """
+    (loc, notes) pairs of the <app> elements of the apparatus section that have
+    a loc and notes, the notes joined with commas.
+    """
+    entries = []
+    if div is None:
+        return ()
+    for app in div.findall(".//tei:app", NS):
+        if 'loc' in app.attrib:
+            notes = [note.text.strip() for note in app.findall("tei:note", NS) if note.text]
+            if notes:
+                entries.append((app.attrib['loc'], ', '.join(notes)))
+    return tuple(entries)
+
+
+def extract_apparatus_english(div, entries=None):
+    """
+    Extract apparatus text from <app> elements in the apparatus section.
+    First tries to find the English header, then extracts all notes from app elements
+    (or takes the extract_apparatus_entries() already made of them).
+    """
+    texts = []
+    if div is None:
+        return ""
+        
+    # First try to get the English header
+    head = div.find(".//tei:head[@xml:lang='en']", NS)
+    if head is not None and head.text:
+        texts.append(head.text.strip())
+        
+    # Then get all app elements and their notes
+    if entries is None:
+        entries = extract_apparatus_entries(div)
+    texts.extend(f"Line {loc}: {notes}" for loc, notes in entries)
+    
+    return "\n".join(texts)
+
+
+def strip_blank_lines(text):
+    """Drop empty lines while preserving intentional line breaks."""
+    return "\n".join(line for line in text.splitlines() if line.strip())
+
+
+_LINE_ENDS = '\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+
+def strip_blank_lines_at(text, starts, strip=False):
+    """
+    strip_blank_lines() of text (stripped first if strip) that carries the
+    (n, offset) line starts of the lines target along. Returns the text and the
+    (n, start, end) span of every line in it, without trailing whitespace; a
+    line starting on a dropped blank line starts with the next line kept.
+    """
+    if strip:
+        stripped = text.lstrip()
+        lead = len(text) - len(stripped)
+        text = stripped.rstrip()
+    else:
+        lead = 0
+    starts = [(n, offset - lead) for n, offset in starts]
+    pieces = []
+    moved = []
+    length = line_start = i = 0
+    for line in text.splitlines(True):
+        line_end = line_start + len(line)
+        content = line.rstrip(_LINE_ENDS)
+        if content.strip():
+            at = length + 1 if pieces else 0
+            pieces.append(content)
+            length = at + len(content)
+            while i < len(starts) and starts[i][1] < line_end:
+                n, offset = starts[i]
+                moved.append((n, at + min(max(offset - line_start, 0), len(content))))
+                i += 1
+        line_start = line_end
+    moved.extend((n, length) for n, _ in starts[i:])
+    text = "\n".join(pieces)
+    spans = []
+    for j, (n, start) in enumerate(moved):
+        end = moved[j + 1][1] if j + 1 < len(moved) else len(text)
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        spans.append((n, start, end))
+    return text, tuple(spans)
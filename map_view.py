@@ -3,10 +3,14 @@ Helper functions for the map view in the main application.
 """
 import xml.etree.ElementTree as ET
 import streamlit as st
-import folium
-import pydeck as pdk
 import pandas as pd
 
+from startup import lazy_module
+
+# Only needed once a map is drawn
+folium = lazy_module("folium")
+pdk = lazy_module("pydeck")
+
 def get_xml_references(xml_string):
     """Parses the XML string and returns a set of all 'ref' attribute values."""
     if not xml_string:
@@ -0,0 +1,147 @@
+"""
+Authority lookups and the mapping of monument records onto Network View rows.
+"""
+import json
+from pathlib import Path
+
+from facets import FacetIndex
+from records import record_year
+from startup import lazy_module
+
+# Only needed by the Network View itself, not by the snapshot builder
+pd = lazy_module("pandas")
+nx = lazy_module("networkx")
+
+
+# authority lists ------------------------------------------------------------
+def read_json(path) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_auth(auth_dir, filename: str, root_key: str, term_key: str = "term", read=read_json) -> dict:
+    """Return dict {id: english_label} for a given authority .json"""
+    data = read(Path(auth_dir) / filename)
+    body = data[root_key]["body"]
+
+    # Handle both list/item and listPlace/place structures
+    if "list" in body:
+        items = body["list"]["item"]
+    elif "listPlace" in body:
+        items = body["listPlace"]["place"]
+    else:
+        raise ValueError(f"Unknown structure in {filename}")
+
+    mapping = {}
+    for item in items:
+        xml_id = item["_xml:id"]
+        term = item.get(term_key, {})
+
+        try:
+            if isinstance(term, list):
+                # multiple lang variants, pick the one with _xml:lang == "en"
+                en_label = next(t["__text"] for t in term
+                              if t.get("_xml:lang") == "en")
+            else:
+                # single term object
+                if isinstance(term, dict):
+                    if term.get("_xml:lang") == "en":
+                        en_label = term["__text"]
+                    else:
+                        # try to get English from gloss if available
+                        gloss = item.get("gloss", {})
+                        if isinstance(gloss, dict) and gloss.get("_xml:lang") == "en":
+                            en_label = gloss["__text"]
+                        else:
+                            # fallback to any available text
+                            en_label = term.get("__text", "unknown")
+                else:
+                    en_label = "unknown"
+        except (KeyError, TypeError, StopIteration):
+            en_label = "unknown"
+
+        mapping[xml_id] = en_label.strip()
+    return mapping
+
+
+def load_authorities(auth_dir, read=read_json) -> dict:
+    """
+    Load the authority lists the network records are mapped through.
+    read(path) returns the parsed JSON of a file, e.g. from a corpus snapshot.
+    """
+    return {
+        "materials": load_auth(auth_dir, "materials.json", "materials", read=read),
+        "objects":   load_auth(auth_dir, "objects.json",   "objects", read=read),
+        "origlocs":  load_auth(auth_dir, "origloc.json",   "origloc", term_key="placeName", read=read),
+        "places":    load_auth(auth_dir, "places.json",    "places",  term_key="placeName", read=read),
+    }
+
+
+# Network records -----------------------------------------------------------
+def network_record(record, authorities: dict) -> dict:
+    """Map a MonumentRecord onto the plain record the network is built from."""
+    materials = authorities["materials"]
+    objects = authorities["objects"]
+    origlocs = authorities["origlocs"]
+
+    # inscription identifier (<title xml:lang="en"> or filename)
+    insc_id = record.title or Path(record.name).stem
+
+    mats = [materials.get(ref_id, label) for ref_id, label in record.materials]
+    objs = [objects.get(ref_id, label) for ref_id, label in record.objects]
+    locs = [origlocs.get(ref_id, label) for ref_id, label in record.orig_places]
+    locs = [l for l in locs if l]            # drop blanks
+
+    year = record_year(record)
+    decade = (year // 10) * 10 if year else None
+
+    return {
+        "inscription": insc_id,
+        "materials":   mats or ["unknown"],
+        "objects":     objs   or ["unknown"],
+        "origlocs":    locs   or ["unknown"],
+        "year":        year,
+        "decade":      f"{decade}s" if decade else "undated",
+        "src":         record.name
+    }
+
+
+def network_frame(records):
+    """One row per (record, material, object, original location) combination."""
+    return (
+        pd.json_normalize(records, 
+                          record_path=["materials"], 
+                          meta=["inscription", "objects", "origlocs", "decade", "src", "year"])
+        .rename(columns={0: "material_"})  # rename the materials column
+        .explode("objects").rename(columns={"objects": "object"})
+        .explode("origlocs").rename(columns={"origlocs": "origloc"})
+    )
+
+
+# Sidebar filters of the Network View and the columns they select on
+NETWORK_FACETS = {"Decade": "decade", "Material": "material_",
+                  "Object type": "object", "Original location": "origloc"}
+
+
+def network_facets(df):
+    """Bitsets of the frame's row positions for every value of the sidebar filters."""
+    return FacetIndex(range(len(df)), {facet: df[column].tolist()
+                                       for facet, column in NETWORK_FACETS.items()})
+
+
+def network_graph(df):
+    """Link every inscription to its material, object type, original location and decade."""
+    G = nx.Graph()
+
+    for _, row in df.iterrows():
+        insc = f"🪧 {row.inscription}"
+        mat  = f"🪨 {row.material_}"
+        obj  = f"📐 {row.object}"
+        loc  = f"📍 {row.origloc}"
+        dec  = f"📅 {row.decade}"
+
+        G.add_node(insc, type="inscription")
+        for node in (mat, obj, loc, dec):
+            G.add_node(node, type="attr")
+            G.add_edge(insc, node)
+    return G
@@ -0,0 +1,119 @@
+"""
+Search keys for Church Slavonic editions and the English sections.
+
+normalize_text() folds case and strips diacritics (NFD, then every combining
+mark, which removes underdots, ligature ties, titla and supralines).
+normalize_edition() additionally removes the Leiden sigla that format_leiden_text
+adds around letters (brackets, erasure and overstrike marks, uncertainty marks,
+gap markers) and returns two keys: the expanded form, where abbreviation
+expansions are read in, and the abbreviated form, where they are left out.
+Both are computed once when a record is indexed; queries go through the same
+functions so that they compare like with like. normalize_offsets() produces the
+same keys together with the position in the original text of every character,
+so that matches can be shown in the text as it is rendered.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+# Letter variants that are spelled interchangeably in the inscriptions
+LETTER_FOLDS = str.maketrans({
+    'ѡ': 'о', 'ꙍ': 'о', 'ѻ': 'о', 'ꙩ': 'о', 'ꙫ': 'о', 'ꙭ': 'о', 'ꚙ': 'о', 'ꚛ': 'о',
+    'ꙋ': 'у', 'ѹ': 'у',
+    'і': 'и', 'ї': 'и',
+    'ꙑ': 'ы',
+    'ꙁ': 'з',
+    'ѳ': 'ф',
+    # Private-use glyphs of the edition fonts
+    '\ue205': 'и', '\ue20d': 'ч', '\ue201': None,
+    '¯': None,   # supraline as a spacing mark
+    '΄': None,   # apex
+})
+
+# Inline HTML and Leiden markup that is not part of any word
+_MARKUP = re.compile(r'</?span[^>]*>|<D=\.\S*|=D>|\|(?:corr|reg)\|')
+# Gap and vacat markers: [....] [.?] [.3] [2-3] [2+] [≤3] (Lines: ...) vac.?
+_GAPS = re.compile(r'\[(?:\.+|\.\?|\.\d+|\d+-\d+\??|\d+\+\??|≤\d+\??)\]'
+                   r'|\(Lines: [^)]*\)|vac\.\??\d*(?:lin)?')
+# Parenthesised expansions, subaudible words and notes
+_PARENS = re.compile(r'\(([^()]*)\)')
+# Brackets and marks added by the Leiden conventions, removed from within words
+_SIGLA_CHARS = '[]〚〛《》{}⟨⟩<>_`´/\\?*'
+_SIGLA = str.maketrans('', '', _SIGLA_CHARS)
+# Symbols that stand between words
+_SEPARATOR_CHARS = '♱։⸱|'
+_SEPARATORS = str.maketrans(dict.fromkeys(_SEPARATOR_CHARS, ' '))
+_SPACES = re.compile(r'\s+')
+_WORD_SIGLA = str.maketrans('', '', _SIGLA_CHARS + '()')
+
+
+def normalize_text(text):
+    """Casefolded text without combining marks and with variant letters folded."""
+    decomposed = unicodedata.normalize('NFD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _SPACES.sub(' ', stripped.translate(LETTER_FOLDS).casefold()).strip()
+
+
+def _strip_sigla(text):
+    return normalize_text(text.translate(_SEPARATORS).translate(_SIGLA))
+
+
+def drop_gap_markers(text):
+    """Replace the gap and vacat markers of rendered Leiden text with spaces."""
+    return _GAPS.sub(' ', text)
+
+
+def normalize_words(text):
+    """
+    Search key of edition text written without Leiden markup (the search target
+    of the renderer): separators count as spaces, stray sigla and parentheses are
+    dropped, then the text is normalised like the other keys.
+    """
+    return normalize_text(text.translate(_SEPARATORS).translate(_WORD_SIGLA))
+
+
+def normalize_edition(text):
+    """Return the (expanded, abbreviated) search keys of a rendered Leiden edition."""
+    text = _GAPS.sub(' ', _MARKUP.sub(' ', text))
+    expanded = _strip_sigla(_PARENS.sub(r'\1', text))
+    abbreviated = _strip_sigla(_PARENS.sub('', text))
+    return expanded, abbreviated
+
+
+@lru_cache(maxsize=4096)
+def _fold(char):
+    decomposed = unicodedata.normalize('NFD', char)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' ' if stripped.isspace() else stripped.translate(LETTER_FOLDS).casefold()
+
+
+def normalize_offsets(text, edition=False):
+    """
+    Return (key, offsets): the normalize_text() key of text, or the expanded
+    normalize_edition() key if edition is true, and for every character of the
+    key the index in text of the character it was produced from.
+    """
+    dropped = {}  # index -> replacement for markup and gap markers
+    if edition:
+        for pattern in (_MARKUP, _GAPS):
+            for match in pattern.finditer(text):
+                dropped[match.start()] = ' '
+                dropped.update(dict.fromkeys(range(match.start() + 1, match.end()), ''))
+    key = []
+    offsets = []
+    for i, char in enumerate(text):
+        char = dropped.get(i, char)
+        if edition:
+            if char in '()' or char in _SIGLA_CHARS:
+                continue
+            if char in _SEPARATOR_CHARS:
+                char = ' '
+        for folded in _fold(char) if char else '':
+            if folded == ' ' and (not key or key[-1] == ' '):
+                continue
+            key.append(folded)
+            offsets.append(i)
+    if key and key[-1] == ' ':
+        key.pop()
+        offsets.pop()
+    return ''.join(key), offsets
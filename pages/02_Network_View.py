@@ -1,5 +1,5 @@
 # app.py  –  Streamlit network explorer for TEI inscriptions
-# ⚙︎ requires: streamlit, lxml, pandas, networkx, pyvis
+# ⚙︎ requires: streamlit, pandas, networkx, pyvis
 
 import streamlit as st
 st.set_page_config(
@@ -9,158 +9,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+import os
+import sys
+import tempfile
 from pathlib import Path
-import json
-import re
-from datetime import datetime
 import pandas as pd
-import networkx as nx
-from lxml import etree
 from pyvis.network import Network
 import streamlit.components.v1 as components
 
-
-###############################################################################
-# 1. Config & helpers
-###############################################################################
-
-
-DATA_DIR = Path(__file__).resolve().parent.parent / "data"      # where the data files are 
-TEI_DIR = DATA_DIR / "xmls"       # sample XMLs directory
-AUTH_DIR = DATA_DIR / "authority"    # authority files directory
-
-# authority lists ------------------------------------------------------------
-def load_auth(filename: str, root_key: str, term_key: str = "term") -> dict:
-    """Return dict {id: english_label} for a given authority .json"""
-    path = AUTH_DIR / filename
-    data = json.load(path.open(encoding='utf-8'))
-    body = data[root_key]["body"]
-    
-    # Handle both list/item and listPlace/place structures
-    if "list" in body:
-        items = body["list"]["item"]
-    elif "listPlace" in body:
-        items = body["listPlace"]["place"]
-    else:
-        raise ValueError(f"Unknown structure in {filename}")
-        
-    mapping = {}
-    for item in items:
-        xml_id = item["_xml:id"]
-        term = item.get(term_key, {})
-        
-        try:
-            if isinstance(term, list):
-                # multiple lang variants, pick the one with _xml:lang == "en"
-                en_label = next(t["__text"] for t in term
-                              if t.get("_xml:lang") == "en")
-            else:
-                # single term object
-                if isinstance(term, dict):
-                    if term.get("_xml:lang") == "en":
-                        en_label = term["__text"]
-                    else:
-                        # try to get English from gloss if available
-                        gloss = item.get("gloss", {})
-                        if isinstance(gloss, dict) and gloss.get("_xml:lang") == "en":
-                            en_label = gloss["__text"]
-                        else:
-                            # fallback to any available text
-                            en_label = term.get("__text", "unknown")
-                else:
-                    en_label = "unknown"
-        except (KeyError, TypeError, StopIteration):
-            en_label = "unknown"
-                
-        mapping[xml_id] = en_label.strip()
-    return mapping
-
-MATERIALS = load_auth("materials.json", "materials")
-OBJECTS   = load_auth("objects.json",   "objects")
-ORIGLOCS  = load_auth("origloc.json",   "origloc", term_key="placeName")
-PLACES    = load_auth("places.json",    "places",  term_key="placeName")
-
-
-# XML utilities --------------------------------------------------------------
-NS = {"tei": "http://www.tei-c.org/ns/1.0"}
-
-def text_of(el):
-    """Return the (stripped) text content of an element, incl. its children."""
-    return "".join(el.itertext()).strip()
-
-def pick_en(el_list):
-    """Pick first child with @xml:lang='en', else fallback to bare element."""
-    for el in el_list:
-        if el.get("{http://www.w3.org/XML/1998/namespace}lang") == "en":
-            return text_of(el)
-    return text_of(el_list[0]) if el_list else ""
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from corpus import ingest_files
+from records import extract_record
+from network_data import network_facets, network_frame, network_graph, network_record
+from resources import DATA_DIR, get_corpus, get_corpus_summary, get_network_authorities, get_network_view
 
 
 ###############################################################################
-# 2. Parse one TEI file
+# 1. Config & authority lists
 ###############################################################################
 
-def parse_tei(path: Path) -> dict:
-    tree = etree.parse(str(path))
-    root = tree.getroot()
-
-    # file/inscription identifier (filename or <title xml:lang="en">)
-    title_el = root.xpath(".//tei:titleStmt/tei:title[@xml:lang='en']", namespaces=NS)
-    insc_id  = title_el[0].text if title_el else path.stem
-
-    # materials ---------------------------------------------------------------
-    mats = []
-    for mat in root.xpath(".//tei:support/tei:material[@xml:lang='en']", namespaces=NS):
-        mat_id = (mat.get("ref") or "").split("#")[-1]
-        mats.append(MATERIALS.get(mat_id, text_of(mat)))
-
-    # objects -----------------------------------------------------------------
-    objs = []
-    for obj in root.xpath(".//tei:support/tei:objectType[@xml:lang='en']", namespaces=NS):
-        obj_id = (obj.get("ref") or "").split("#")[-1]
-        objs.append(OBJECTS.get(obj_id, text_of(obj)))
 
-    # original place ----------------------------------------------------------
-    locs = []
-    for op in root.xpath(".//tei:history/tei:origin/tei:origPlace", namespaces=NS):
-        loc_id = (op.get("ref") or "").split("#")[-1]
-        locs.append(ORIGLOCS.get(loc_id, pick_en(op.xpath("./tei:seg", namespaces=NS))))
-    locs = [l for l in locs if l]            # drop blanks    # dating from value attribute or notBefore/notAfter --------------------------------
-    od = root.find(".//tei:origin/tei:origDate", namespaces=NS)
-    year = None
-    if od is not None:
-        try:
-            # First try to get the value attribute
-            value = od.get('value')
-            if value:
-                year = int(value)
-            else:
-                # Fall back to notBefore/notAfter if value is not present
-                nb, na = int(od.get("notBefore", 0)), int(od.get("notAfter", 0))
-                year = int((nb + na) / 2) if nb and na else nb or na
-        except ValueError:
-            # If numeric conversion fails, try to get year from the English text
-            seg = od.find(".//tei:seg[@xml:lang='en']", namespaces=NS)
-            if seg is not None and seg.text:
-                try:
-                    year = int(seg.text.strip())
-                except ValueError:
-                    pass
-    decade = (year // 10) * 10 if year else None
+TEI_DIR = DATA_DIR / "xmls"       # sample XMLs directory
 
-    return {
-        "inscription": insc_id,
-        "materials":   mats or ["unknown"],
-        "objects":     objs   or ["unknown"],
-        "origlocs":    locs   or ["unknown"],
-        "year":        year,
-        "decade":      f"{decade}s" if decade else "undated",
-        "src":         path.name
-    }
+# Shared with app.py and every other session
+AUTHORITIES = get_network_authorities()
 
 
 ###############################################################################
-# 3. Streamlit UI
+# 2. Streamlit UI
 ###############################################################################
 
 st.title("📜 Epigraphic Network Explorer")
@@ -171,69 +47,55 @@ use_uploader = st.sidebar.toggle("Upload XML", False)
 if use_uploader:
     uploaded = st.sidebar.file_uploader(
         "Drop one or more TEI files", type=["xml"], accept_multiple_files=True)
-    tei_files = [Path(f.name).with_suffix(".xml") for f in uploaded]
-    # write to temp so that lxml can parse
-    for stfile, tmp in zip(uploaded, tei_files):
-        tmp.write_bytes(stfile.getvalue())
+    report = ingest_files(((f.name, f.getvalue()) for f in uploaded), extract_record)
+    monuments = [report.records[f.name] for f in uploaded if f.name in report.records]
 else:
-    tei_files = sorted(TEI_DIR.glob("*.xml"))
-    st.sidebar.write(f"Using **{len(tei_files)}** XML files in `tei_docs/`")
-
-if not tei_files:
+    # The same shared corpus as the main page
+    corpus = get_corpus()
+    monuments = get_corpus_summary(corpus, corpus.version).records
+    report = corpus.last_report
+    st.sidebar.write(f"Using **{len(monuments)}** XML files in `tei_docs/`")
+
+for file_name, error in (report.errors if use_uploader else corpus.errors).items():
+    st.warning(f"Skipping {file_name}: {error}")
+if report.parsed:
+    st.sidebar.caption(f"Parsed {report.parsed} files in {report.elapsed:.2f} s "
+                       f"using {report.workers} worker(s)")
+
+if not monuments:
     st.warning("No TEI files found. Upload or place them in the folder and reload.")
     st.stop()
 
-# --- Parse all TEI files -----------------------------------------------------
-records = [parse_tei(p) for p in tei_files]
-df = (
-    pd.json_normalize(records, 
-                      record_path=["materials"], 
-                      meta=["inscription", "objects", "origlocs", "decade", "src", "year"])
-    .rename(columns={0: "material_"})  # rename the materials column
-    .explode("objects").rename(columns={"objects": "object"})
-    .explode("origlocs").rename(columns={"origlocs": "origloc"})
-)
+if use_uploader:
+    df = network_frame([network_record(m, AUTHORITIES) for m in monuments])
+    facets = network_facets(df)
+else:
+    # Rows and filter bitsets are built once per corpus version
+    df, facets = get_network_view(corpus, corpus.version)
 
 ###############################################################################
-# 4. Sidebar filters
+# 3. Sidebar filters
 ###############################################################################
-decades   = sorted(df["decade"].unique())
-materials = sorted(df["material_"].unique())
-objects   = sorted(df["object"].unique())
-origlocs  = sorted(df["origloc"].unique())
+# Each filter is a bitset OR of its picked values, the filters are ANDed; the
+# labels count the rows a value keeps given the other filters
+facet_keys = {facet: f"network_{facet.lower().replace(' ', '_')}" for facet in facets.bits}
+selection = {facet: st.session_state.get(key, facets.values(facet)) for facet, key in facet_keys.items()}
+facet_counts = facets.counts(selection)
+for facet, key in facet_keys.items():
+    counts = facet_counts[facet]
+    selection[facet] = st.sidebar.multiselect(
+        facet, facets.values(facet), default=facets.values(facet), key=key,
+        format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0)})")
 
-pick_decade   = st.sidebar.multiselect("Decade", decades, default=decades)
-pick_material = st.sidebar.multiselect("Material", materials, default=materials)
-pick_object   = st.sidebar.multiselect("Object type", objects, default=objects)
-pick_origloc  = st.sidebar.multiselect("Original location", origlocs, default=origlocs)
-
-mask = (
-    df["decade"].isin(pick_decade) &
-    df["material_"].isin(pick_material) &
-    df["object"].isin(pick_object) &
-    df["origloc"].isin(pick_origloc)
-)
-df_filt = df[mask]
+df_filt = df.iloc[facets.keys_of(facets.match(selection))]
 
 ###############################################################################
-# 5. Build network
+# 4. Build network
 ###############################################################################
-G = nx.Graph()
-
-for _, row in df_filt.iterrows():
-    insc = f"🪧 {row.inscription}"
-    mat  = f"🪨 {row.material_}"
-    obj  = f"📐 {row.object}"
-    loc  = f"📍 {row.origloc}"
-    dec  = f"📅 {row.decade}"
-
-    G.add_node(insc, type="inscription")
-    for node in (mat, obj, loc, dec):
-        G.add_node(node, type="attr")
-        G.add_edge(insc, node)
+G = network_graph(df_filt)
 
 ###############################################################################
-# 6. Visualise with PyVis
+# 5. Visualise with PyVis
 ###############################################################################
 try:
     # Create a temporary directory for the network file
@@ -287,7 +149,7 @@ except Exception as e:
     st.write("Displaying fallback table view of the network data:")
 
 ###############################################################################
-# 7. Data & download
+# 6. Data & download
 ###############################################################################
 st.subheader("Edgelist")
 edge_df = pd.DataFrame(G.edges(), columns=["source", "target"])
@@ -298,7 +160,7 @@ def _to_csv(df): return df.to_csv(index=False).encode()
 st.download_button("⬇️ Download CSV", _to_csv(edge_df), "edgelist.csv", "text/csv")
 
 ###############################################################################
-# 8. Footnote
+# 7. Footnote
 ###############################################################################
 st.markdown(
     """
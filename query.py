@@ -0,0 +1,236 @@
+"""
+Headless querying of the corpus, as a library and from the command line.
+
+QueryEngine loads the corpus once (from the snapshot and the parse cache, like
+the application) and answers any number of queries with the search index of the
+Search & Query tab. run() turns a stream of queries into JSON-ready rows, one
+per query, with the ranked records, the fields they matched in and a snippet
+of every match (and, in the edition, the numbers of the lines it is on).
+
+    python query.py queries.txt > results.jsonl
+    echo "царь" | python query.py - --field "Church Slavonic Text"
+
+Every input line is either a search term or a JSON object with "term" and,
+optionally, "id", "field", "mode", "abbreviations", "similarity", "limit"
+and "facets" ({facet: [values]}) overriding the command-line defaults. In the
+structure mode terms are structural queries such as <gap unit="line">
+(see structure.py).
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from bibliography import format_bibl_entries, load_bibliography
+from corpus import Corpus
+from edition_lines import EditionLines
+from facets import facet_value, record_facets
+from search import (ABBREVIATION_MODES, EDITION, FIELD_SECTIONS, FUZZY_THRESHOLD, SEARCH_FIELDS, SearchIndex,
+                    snippet)
+from snapshot import SNAPSHOT_FILE, load_snapshot
+from structure import ElementIndex
+
+BASE_DIR = Path(__file__).resolve().parent
+QUERY_MODES = ("exact", "fuzzy", "structure")
+
+
+class QueryEngine:
+    """The corpus, bibliography, search and element indexes and facets of a data folder, loaded once."""
+
+    def __init__(self, data_dir=BASE_DIR / 'data', cache_dir=BASE_DIR / '.cache', workers=None,
+                 use_snapshot=True):
+        data_dir = Path(data_dir)
+        snapshot = load_snapshot(data_dir / SNAPSHOT_FILE, data_dir) if use_snapshot else None
+        self.corpus = Corpus(data_dir / 'xmls', cache_dir, workers=workers)
+        if snapshot is not None:
+            self.corpus.seed(snapshot.corpus_entries())
+        self.report = self.corpus.refresh()
+
+        biblio_xml = data_dir / 'bibliography.xml'
+        refs = snapshot.bibliography_refs() if snapshot is not None else None
+        if refs is None:
+            refs = load_bibliography(str(biblio_xml)) if biblio_xml.exists() else {}
+        self.bibliography = refs
+        self.index = SearchIndex(self.format_bibliography).attach(self.corpus)
+        self.elements = ElementIndex().attach(self.corpus)
+        self.facets = record_facets(self.corpus.records())
+
+    def format_bibliography(self, entries):
+        return format_bibl_entries(entries, self.bibliography)
+
+    def facet_selection(self, facets):
+        """
+        facets ({facet: values}) with every value written as the facet keeps it
+        (Type, Material and Category in lower case). Raises ValueError for a
+        facet or value that does not exist.
+        """
+        unknown = set(facets) - set(self.facets.bits)
+        if unknown:
+            raise ValueError(f"unknown facet(s): {', '.join(sorted(unknown))}")
+        selection = {}
+        unknown = []
+        for facet, values in facets.items():
+            selected = selection[facet] = []
+            for value in [values] if isinstance(values, str) else values:
+                if facet_value(facet, value) in self.facets.bits[facet]:
+                    selected.append(facet_value(facet, value))
+                else:
+                    unknown.append(f"{facet}={value}")
+        if unknown:
+            raise ValueError(f"unknown facet value(s): {', '.join(unknown)}")
+        return selection
+
+    def query(self, term, field="All Fields", mode="exact", abbreviations="both",
+              similarity=FUZZY_THRESHOLD, facets=None):
+        """
+        SearchResults of every record matching one query, best first; facets
+        ({facet: values}) restricts the records. Raises ValueError for an
+        unknown field, mode, facet or facet value or an invalid structural query.
+        """
+        if mode not in QUERY_MODES:
+            raise ValueError(f"unknown mode {mode!r}")
+        if field not in FIELD_SECTIONS:
+            raise ValueError(f"unknown field {field!r}")
+        if facets:
+            facets = self.facet_selection(facets)
+        # Ranked without a limit: the facets may drop any of the best matches
+        if mode == "fuzzy":
+            results = self.index.fuzzy_search(term, similarity, limit=None)
+        elif mode == "structure":
+            results = self.elements.query(term)
+        else:
+            results = self.index.search(term, field, abbreviations)
+        if facets:
+            matching = self.facets.match(facets)
+            results = results.filter(lambda name: self.facets.contains(matching, name))
+        return results
+
+    def run(self, queries, snippet_width=60, **defaults):
+        """
+        Yield one row per query: its id and term, the number of hits and the
+        first limit of the ranked results. queries are terms or dicts of query()
+        arguments plus "id" and "limit". A query that cannot be run (or a
+        ValueError read_queries() yielded in its place) gives a row with its id
+        and the error instead, and the next query is run.
+        """
+        for number, query in enumerate(queries, 1):
+            options = dict(defaults)
+            options.update(query if isinstance(query, dict) else {'term': query})
+            query_id = options.pop('id', number)
+            try:
+                if isinstance(query, Exception):
+                    raise query
+                yield self._run_one(query_id, options, snippet_width)
+            except (KeyError, TypeError, ValueError) as e:
+                yield {'query_id': query_id, 'error': str(e)}
+
+    def _run_one(self, query_id, options, snippet_width):
+        """The row of one query, options being query() arguments plus "term" and "limit"."""
+        term = options.pop('term', None)
+        if not isinstance(term, str):
+            raise ValueError("query has no \"term\"")
+        limit = options.pop('limit', None)
+        results = self.query(term, **options)
+        structural = options.get('mode') == "structure"
+        rows = []
+        for rank, result in enumerate(results.page(1, limit or len(results)), 1):
+            record = result['record']
+            rows.append({
+                'rank': rank,
+                'file_name': result['file_name'],
+                'id': record.id,
+                'title': record.title,
+                'score': round(result['score'], 4),
+                'matches': [self.match_row(record, section, text, term, structural, snippet_width)
+                            for section, text in result['matches']],
+            })
+        # hits counts every match, results only the first limit of them
+        return {'query_id': query_id, 'query': term, 'hits': len(results), 'results': rows}
+
+    @staticmethod
+    def match_row(record, section, text, term, structural, snippet_width):
+        """A match as a field and snippet, edition matches also with the numbers of their lines."""
+        if structural:
+            return {'field': section, 'snippet': text}
+        row = {'field': section, 'snippet': snippet(text, section, term, snippet_width)}
+        if section == EDITION:
+            row['lines'] = [line.number for line in EditionLines(record).hits(term)]
+        return row
+
+
+def read_queries(lines):
+    """
+    Terms or JSON objects, one per non-empty line. A line that is not valid
+    JSON is yielded as a ValueError, which run() reports as that query's error.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith('{'):
+            yield line
+            continue
+        try:
+            query = json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"line {number}: invalid JSON: {e}")
+            continue
+        yield query if isinstance(query, dict) else ValueError(f"line {number}: not a JSON object")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run search queries over the corpus and write JSONL results.")
+    parser.add_argument('queries', help="file with one query per line, or - for stdin")
+    parser.add_argument('--field', default="All Fields", choices=SEARCH_FIELDS)
+    parser.add_argument('--mode', default="exact", choices=QUERY_MODES)
+    parser.add_argument('--abbreviations', default="both", choices=ABBREVIATION_MODES)
+    parser.add_argument('--similarity', type=float, default=FUZZY_THRESHOLD, help="fuzzy mode threshold")
+    parser.add_argument('--limit', type=int, default=20, help="results per query (0 for all)")
+    parser.add_argument('--facet', action='append', default=[], metavar='FACET=VALUE',
+                        help="keep records with this facet value, e.g. Material=marble (repeatable)")
+    parser.add_argument('--snippet-width', type=int, default=60)
+    parser.add_argument('--data-dir', default=str(BASE_DIR / 'data'))
+    parser.add_argument('--cache-dir', default=str(BASE_DIR / '.cache'))
+    parser.add_argument('--workers', type=int, help="ingestion worker processes (default: all cores)")
+    parser.add_argument('--no-snapshot', action='store_true', help="ignore the precompiled snapshot")
+    parser.add_argument('--output', help="write to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    facets = {}
+    for option in args.facet:
+        facet, sep, value = option.partition('=')
+        if not sep:
+            parser.error(f"--facet expects FACET=VALUE, got {option!r}")
+        facets.setdefault(facet, []).append(value)
+
+    start = time.perf_counter()
+    engine = QueryEngine(args.data_dir, args.cache_dir, args.workers, not args.no_snapshot)
+    try:
+        facets = engine.facet_selection(facets)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Loaded {len(engine.corpus.by_name)} records in {time.perf_counter() - start:.2f} s",
+          file=sys.stderr)
+    for name, error in engine.corpus.errors.items():
+        print(f"skipped {name}: {error}", file=sys.stderr)
+
+    source = sys.stdin if args.queries == '-' else open(args.queries, encoding='utf-8')
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        rows = engine.run(read_queries(source), snippet_width=args.snippet_width, field=args.field,
+                          mode=args.mode, abbreviations=args.abbreviations, similarity=args.similarity,
+                          limit=args.limit or None, facets=facets or None)
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False) + '\n')
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
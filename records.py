@@ -0,0 +1,437 @@
+"""
+Compact monument records holding only the fields the application tabs display or search.
+
+Records are plain, picklable objects, so they can be produced by the ingestion
+workers, stored in the on-disk corpus cache and shared without keeping the
+ElementTree of every document (or its serialised XML) in memory. They are the
+canonical form of a document: every view (tabs, search, map and Network View)
+reads these fields instead of walking the TEI tree itself.
+"""
+import xml.etree.ElementTree as ET
+
+from leiden import (NS, extract_english_text, extract_apparatus_english, extract_apparatus_entries,
+                    render, strip_blank_lines_at)
+
+TEI_ROOT = "{http://www.tei-c.org/ns/1.0}TEI"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+
+class MonumentRecord:
+    """
+    Extracted fields of one TEI monument document.
+
+    ``edition`` is a tuple of (label, Leiden text) parts: a single unlabelled part for
+    an edition div, or one part per top-level textpart, and ``lines`` holds the
+    (n, start, end) spans in its text of the numbered lines of every part (see
+    edition_lines.EditionLines). ``apparatus_entries`` are the (line, notes) pairs
+    the ``apparatus`` text is made of. ``bibliography`` holds
+    (bibliography id, page) pairs that are resolved against the bibliography at
+    display time. ``objects``, ``materials`` and ``orig_places`` keep the
+    (authority id, English label) pair of every support/origin entry so the
+    Network View can map them through the authority lists, and ``date_attrs``
+    is the (value, notBefore, notAfter) triple of the origDate. ``elements`` counts
+    the elements of the edition as ((tag, attributes, textpart), count) pairs, the
+    attributes being sorted (name, value) pairs and textpart the ``n`` of the
+    enclosing textpart div ("" outside of one).
+    The original XML is not kept; read it from disk via ``name``.
+    """
+
+    __slots__ = (
+        'name', 'id', 'title', 'editors',
+        'type', 'material', 'institution', 'inventory',
+        'dimensions', 'letter_size', 'layout',
+        'find_spot', 'origin', 'origin_ref', 'date', 'date_attrs', 'category',
+        'objects', 'materials', 'orig_places',
+        'edition', 'lines', 'apparatus', 'apparatus_entries', 'translation', 'commentary', 'bibliography',
+        'refs', 'images', 'elements',
+    )
+
+    def __init__(self, **fields):
+        for slot in self.__slots__:
+            setattr(self, slot, fields.get(slot))
+
+    def __repr__(self):
+        return f"MonumentRecord({self.name!r})"
+
+    @property
+    def leiden_text(self):
+        """The whole edition as one string, textparts prefixed with their labels."""
+        if len(self.edition) == 1 and not self.edition[0][0]:
+            return self.edition[0][1]
+        return "\n\n".join(f"{label}.\n{text}" for label, text in self.edition)
+
+
+_LOCAL_NAMES = {}
+
+
+def _local(tag):
+    """Return the tag without its namespace (comments and PIs have no name)."""
+    try:
+        return _LOCAL_NAMES[tag]
+    except KeyError:
+        name = _LOCAL_NAMES[tag] = tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+        return name
+
+
+def _text(elem):
+    return elem.text.strip() if elem.text is not None else ""
+
+
+def _text_of(elem):
+    """Return the (stripped) text content of an element, incl. its children."""
+    return "".join(elem.itertext()).strip()
+
+
+def _ref_id(elem):
+    return (elem.get("ref") or "").split("#")[-1]
+
+
+def _child_seg(elem, lang):
+    for child in elem:
+        if _local(child.tag) == 'seg' and child.get(XML_LANG) == lang:
+            return child
+    return None
+
+
+def count_elements(div, counts, textpart=""):
+    """
+    Add the elements below an edition or textpart div to counts, keyed by
+    (tag, sorted (attribute, value) pairs, textpart). Nested textpart divs
+    set the textpart of their own elements.
+    """
+    for child in div:
+        tag = _local(child.tag)
+        if not tag:
+            continue
+        if tag == 'div' and child.get('type') == 'textpart':
+            count_elements(child, counts, child.get('n', textpart))
+            continue
+        attributes = tuple(sorted((_local(name), value) for name, value in child.attrib.items()))
+        key = (tag, attributes, textpart)
+        counts[key] = counts.get(key, 0) + 1
+        count_elements(child, counts, textpart)
+    return counts
+
+
+def extract_bibl_entries(div):
+    """Return (bibliography id, page) pairs for every <bibl> in the bibliography div."""
+    if div is None:
+        return ()
+    entries = []
+    for bibl in div.iter("{http://www.tei-c.org/ns/1.0}bibl"):
+        same = bibl.get('sameAs', '')
+        ref_id = same.split(':', 1)[1] if same.startswith('bib:') else ''
+        entries.append((ref_id, (bibl.text or "").strip()))
+    return tuple(entries)
+
+
+class _RecordBuilder:
+    """
+    Collects the fields of a MonumentRecord in one walk over the parsed document.
+
+    Handlers are looked up by (parent tag, tag) or by tag alone as each element is
+    visited, so the header is never searched again with find(). Body divs are handed
+    to the Leiden renderer and text extractors instead of being descended into.
+    Single-valued fields keep the first match in document order, as find() would.
+    With further render() targets, the edition divs are rendered in those as well,
+    in the same walk as the Leiden text, and kept in outputs by div path.
+    """
+
+    def __init__(self, name, renders=None, targets=()):
+        self.name = name
+        self.renders = {} if renders is None else renders
+        self.targets = tuple(targets)
+        self.outputs = {}
+        self.edition_key = None
+        self.textpart_keys = []
+        self.body_divs = 0
+        self.fields = {
+            'name': name, 'id': "", 'title': "", 'type': "", 'material': "",
+            'institution': "", 'inventory': "", 'letter_size': "", 'layout': "",
+            'origin': "", 'origin_ref': None, 'date': "", 'date_attrs': None,
+            'find_spot': None, 'category': "", 'edition': (), 'lines': (), 'apparatus': "",
+            'apparatus_entries': (), 'translation': "", 'commentary': "", 'bibliography': (),
+        }
+        self.seen = set()
+        self.editors = []
+        self.objects = []
+        self.materials = []
+        self.orig_places = []
+        self.support_dims = {}
+        self.layout_dims = {}
+        self.textparts = []
+        self.textpart_lines = []
+        self.refs = set()
+        self.images = []
+        self.elements = {}
+
+    def first(self, field, value):
+        """Set a single-valued field unless an earlier element already did."""
+        if field not in self.seen:
+            self.seen.add(field)
+            self.fields[field] = value
+
+    def walk(self, elem, path):
+        tag = _local(elem.tag)
+        parent = path[-1] if path else ''
+        path.append(tag)
+        if tag == 'altIdentifier':
+            path.lang = elem.get(XML_LANG)
+
+        handler = self.BY_PARENT.get((parent, tag)) or self.BY_TAG.get(tag)
+        if handler is not None:
+            handler(self, elem, path)
+
+        if parent == 'body' and tag == 'div':
+            # The div has been rendered; only its refs are still needed
+            self.refs.update(e.attrib['ref'] for e in elem.iter() if 'ref' in e.attrib)
+        else:
+            if parent and 'ref' in elem.attrib:
+                self.refs.add(elem.attrib['ref'])
+            for child in elem:
+                self.walk(child, path)
+
+        if path.pop() == 'altIdentifier':
+            path.lang = None
+
+    # --- teiHeader ---
+    def _title(self, elem, path):
+        if elem.get(XML_LANG) == 'en':
+            self.first('title', elem.text or "")
+
+    def _editor_name(self, elem, path):
+        if path[-3:-1] == ['titleStmt', 'editor'] and elem.get(XML_LANG) == 'en' and elem.text:
+            self.editors.append(elem.text.strip())
+
+    def _idno(self, elem, path):
+        if path[-2] == 'publicationStmt' and elem.get('type') == 'filename':
+            self.first('id', _text(elem))
+        elif path[-2] == 'altIdentifier' and path.lang == 'en':
+            self.first('inventory', _text(elem))
+
+    def _repository_ref(self, elem, path):
+        if path[-3] == 'altIdentifier' and path.lang == 'en' and elem.text:
+            self.first('institution', elem.text.strip())
+
+    def _object_type(self, elem, path):
+        if elem.get(XML_LANG) == 'en':
+            self.first('type', _text(elem))
+            self.objects.append((_ref_id(elem), _text_of(elem)))
+
+    def _material(self, elem, path):
+        if elem.get(XML_LANG) == 'en':
+            self.first('material', _text(elem))
+            self.materials.append((_ref_id(elem), _text_of(elem)))
+
+    def _dimension(self, elem, path):
+        tag = path[-1]
+        if tag == 'dim':
+            if elem.get('type') != 'diameter':
+                return
+            tag = 'diameter'
+        elif tag in ('lenght', 'length'):
+            # Layouts record the height as length (sometimes misspelt)
+            tag = 'height'
+        if path[-3] == 'support':
+            self.support_dims.setdefault(tag, _text(elem))
+        elif path[-3] == 'layoutDesc':
+            self.layout_dims.setdefault(tag, _text(elem))
+
+    def _layout(self, elem, path):
+        if elem.get(XML_LANG) == 'en':
+            self.first('layout', _text(elem))
+
+    def _letter_height(self, elem, path):
+        if path[-3] == 'handDesc':
+            self.first('letter_size', _text(elem))
+
+    def _orig_place(self, elem, path):
+        if path[-3] != 'history':
+            return
+        en_seg = _child_seg(elem, 'en')
+        if 'origin_ref' not in self.seen:
+            self.first('origin_ref', elem.get('ref', ''))
+            self.fields['origin'] = _text(en_seg) if en_seg is not None else ""
+        # Network View label: English seg, else the first seg of any language
+        if en_seg is None:
+            en_seg = next((child for child in elem if _local(child.tag) == 'seg'), None)
+        self.orig_places.append((_ref_id(elem), _text_of(en_seg) if en_seg is not None else ""))
+
+    def _orig_date(self, elem, path):
+        if path[-3] == 'history' and 'date_attrs' not in self.seen:
+            self.first('date_attrs', (elem.get('value'), elem.get('notBefore'), elem.get('notAfter')))
+            en_seg = _child_seg(elem, 'en')
+            self.fields['date'] = _text(en_seg) if en_seg is not None else ""
+
+    def _provenance(self, elem, path):
+        if elem.get('type') == 'found' and 'find_spot' not in self.seen:
+            en_seg = _child_seg(elem, 'en')
+            place = en_seg.find("tei:placeName", NS) if en_seg is not None else None
+            self.first('find_spot', (
+                elem.get('when', ''),
+                (place.text or '').strip() if place is not None else None,
+                place.get('ref', '') if place is not None else '',
+            ))
+
+    def _summary_seg(self, elem, path):
+        if path[-3] == 'msContents' and elem.get(XML_LANG) == 'en':
+            self.first('category', _text(elem))
+
+    # --- facsimile ---
+    def _graphic(self, elem, path):
+        if elem.get("url"):
+            self.images.append(elem.get("url"))
+
+    # --- text/body ---
+    def _div_key(self):
+        return f"text/body/div[{self.body_divs}]"
+
+    def _leiden(self, elem, strip=False):
+        """
+        Blank-line-stripped Leiden text of the current body div and the spans of
+        its lines, reused from renders if there.
+        """
+        key = self._div_key()
+        rendered = self.renders.get(key)
+        if rendered is None or self.targets:
+            outputs = render(elem, ('lines',) + self.targets)
+            if self.targets:
+                self.outputs[key] = outputs
+            raw, starts = outputs['lines']
+            rendered = self.renders[key] = (raw, *strip_blank_lines_at(raw, starts, strip))
+        return rendered[1:]
+
+    def _body_div(self, elem, path):
+        self.body_divs += 1
+        div_type = elem.attrib.get("type", "")
+        if div_type == "edition":
+            if elem.attrib.get(XML_LANG) in ["grc", "chu"]:
+                text, lines = self._leiden(elem)
+                self.fields['edition'] = (("", text),)
+                self.fields['lines'] = (lines,)
+                self.edition_key = self._div_key()
+            count_elements(elem, self.elements)
+        elif div_type == "textpart":
+            text, lines = self._leiden(elem, strip=True)
+            self.textparts.append((elem.attrib.get('n', ''), text))
+            self.textpart_lines.append(lines)
+            self.textpart_keys.append(self._div_key())
+            count_elements(elem, self.elements, elem.attrib.get('n', ''))
+        elif div_type == "apparatus":
+            entries = self.fields['apparatus_entries'] = extract_apparatus_entries(elem)
+            self.fields['apparatus'] = extract_apparatus_english(elem, entries)
+        elif div_type == "translation":
+            self.fields['translation'] = extract_english_text(elem, "seg")
+        elif div_type == "commentary":
+            self.fields['commentary'] = extract_english_text(elem, "seg")
+        elif div_type == "bibliography":
+            self.fields['bibliography'] = extract_bibl_entries(elem)
+
+    BY_PARENT = {
+        ('editor', 'persName'): _editor_name,
+        ('repository', 'ref'): _repository_ref,
+        ('support', 'objectType'): _object_type,
+        ('support', 'material'): _material,
+        ('dimensions', 'height'): _dimension,
+        ('dimensions', 'width'): _dimension,
+        ('dimensions', 'depth'): _dimension,
+        ('dimensions', 'dim'): _dimension,
+        ('layout', 'lenght'): _dimension,
+        ('layout', 'length'): _dimension,
+        ('layout', 'width'): _dimension,
+        ('layout', 'depth'): _dimension,
+        ('layout', 'dim'): _dimension,
+        ('layoutDesc', 'layout'): _layout,
+        ('handNote', 'height'): _letter_height,
+        ('origin', 'origPlace'): _orig_place,
+        ('origin', 'origDate'): _orig_date,
+        ('history', 'provenance'): _provenance,
+        ('summary', 'seg'): _summary_seg,
+        ('facsimile', 'graphic'): _graphic,
+        ('body', 'div'): _body_div,
+    }
+    BY_TAG = {
+        'title': _title,
+        'idno': _idno,
+    }
+
+    def build(self):
+        fields = self.fields
+        if not fields['edition'] and self.textparts:
+            fields['edition'] = tuple(self.textparts)
+            fields['lines'] = tuple(self.textpart_lines)
+        dims = self.support_dims if any(self.support_dims.values()) else self.layout_dims
+        fields['dimensions'] = tuple(dims.get(key, "") for key in ('height', 'width', 'depth', 'diameter'))
+        return MonumentRecord(
+            editors=tuple(self.editors),
+            objects=tuple(self.objects),
+            materials=tuple(self.materials),
+            orig_places=tuple(self.orig_places),
+            refs=frozenset(self.refs),
+            images=tuple(self.images),
+            elements=tuple(self.elements.items()),
+            **fields
+        )
+
+    def edition_outputs(self):
+        """The outputs of the divs the edition was made from, in the order of its parts."""
+        keys = [self.edition_key] if self.edition_key is not None else self.textpart_keys
+        return tuple(self.outputs.get(key, {}) for key in keys)
+
+
+class _Path(list):
+    """Stack of the local tag names of the open elements, plus the nearest altIdentifier language."""
+    lang = None
+
+
+def extract_record(name, data, renders=None):
+    """
+    Parse one TEI file and extract its MonumentRecord in a single walk over the document.
+    Raises ValueError for well-formed XML that is not a TEI document.
+
+    renders, if given, maps the paths of body divs (text/body/div[1], ...) to the
+    (raw, blank-line-stripped, line spans) Leiden renderings of an earlier extraction
+    of the same content; they are reused instead of rendering again, and new ones are added to it.
+    """
+    return _build(name, data, _RecordBuilder(name, renders)).build()
+
+
+def extract_rendered(name, data, targets):
+    """
+    extract_record() that also renders the edition in further render() targets
+    (e.g. 'html', 'search'). Returns the record and, for each part of
+    record.edition, a {target: output} dict.
+    """
+    builder = _build(name, data, _RecordBuilder(name, targets=targets))
+    return builder.build(), builder.edition_outputs()
+
+
+def _build(name, data, builder):
+    root = ET.fromstring(data)
+    if root.tag != TEI_ROOT:
+        raise ValueError(f"File {name} doesn't appear to be a valid TEI document. Root element is {root.tag}")
+    builder.walk(root, _Path())
+    return builder
+
+
+def record_year(record):
+    """Year of a record from its origDate value, the middle of notBefore/notAfter, or its English text."""
+    year = None
+    if record.date_attrs is not None:
+        value, not_before, not_after = record.date_attrs
+        try:
+            # First try to get the value attribute
+            if value:
+                year = int(value)
+            else:
+                # Fall back to notBefore/notAfter if value is not present
+                nb = int(not_before if not_before is not None else 0)
+                na = int(not_after if not_after is not None else 0)
+                year = int((nb + na) / 2) if nb and na else nb or na
+        except ValueError:
+            # If numeric conversion fails, try to get year from the English text
+            try:
+                year = int(record.date)
+            except ValueError:
+                pass
+    return year
@@ -0,0 +1,211 @@
+"""
+Process-wide shared resources for the Streamlit pages.
+
+The corpus, the authority registry, the bibliography and the image index are
+built once per server process (st.cache_resource) and shared by every session.
+They are handed out read-only: mappings, including the entries of the image
+index, are wrapped in MappingProxyType and image data is kept as bytes, so no
+session can change what another one sees. The parsed authority JSON is the
+exception: callers test it with isinstance(..., dict), so its nested dicts and
+lists stay plain and must be treated as read-only.
+The corpus watcher calls invalidate() when a data file changes, which drops
+only the resource built from it; it is rebuilt by the next session that asks.
+"""
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from types import MappingProxyType
+
+import streamlit as st
+
+from bibliography import format_bibl_entries, load_bibliography
+from concordance import ConcordanceIndex
+from corpus import Corpus, CorpusWatcher
+from facets import record_facets
+from network_data import load_authorities, network_facets, network_frame, network_record, read_json
+from search import QUERY_CACHE_SIZE, QueryCache, SearchIndex
+from snapshot import SNAPSHOT_FILE, load_snapshot
+from structure import ElementIndex
+from startup import lazy_module
+
+Image = lazy_module("PIL.Image")
+
+# Configure base paths - handle both local and Hugging Face environments
+if os.getenv('SPACE_ID'):  # We're running on HuggingFace
+    BASE_DIR = Path('/app/src')
+    CACHE_DIR = Path(tempfile.gettempdir()) / "bashtina_cache"
+else:  # We're running locally
+    BASE_DIR = Path(__file__).resolve().parent
+    CACHE_DIR = BASE_DIR / '.cache'
+DATA_DIR = BASE_DIR / 'data'
+XML_DIR = DATA_DIR / 'xmls'
+AUTHORITY_DIR = DATA_DIR / 'authority'
+BIBLIO_XML = DATA_DIR / 'bibliography.xml'
+IMAGES_DIR = BASE_DIR / 'images'
+
+IMAGE_EXTENSIONS = ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp', '*.tiff']
+
+
+def invalidate(path):
+    """Drop the shared resource built from a data file or folder that changed."""
+    path = Path(path)
+    if path == BIBLIO_XML:
+        get_bibliography.clear()
+        get_search_index().reindex()
+    elif path == AUTHORITY_DIR:
+        get_authority_registry.clear()
+        get_network_authorities.clear()
+        get_network_view.clear()
+    elif path == IMAGES_DIR:
+        get_image_index.clear()
+
+
+@st.cache_resource
+def get_snapshot():
+    """The precompiled snapshot built by `python snapshot.py build`, or None."""
+    return load_snapshot(DATA_DIR / SNAPSHOT_FILE, DATA_DIR)
+
+
+@st.cache_resource
+def get_corpus() -> Corpus:
+    """
+    Load all XML files of the data folder as compact MonumentRecords.
+    Records are kept in an on-disk cache, so only new or changed files are parsed again,
+    and those are parsed in parallel by the ingestion engine. When a snapshot is
+    available its records are used for every file it is still fresh for. A watcher
+    thread then re-extracts just the files that are added, edited or deleted, and
+    invalidates the other shared resources when their files change.
+    """
+    corpus = Corpus(XML_DIR, CACHE_DIR)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        corpus.seed(snapshot.corpus_entries())
+    corpus.refresh()
+    CorpusWatcher(corpus, [AUTHORITY_DIR, BIBLIO_XML, IMAGES_DIR], on_change=invalidate).start()
+    return corpus
+
+
+class CorpusSummary:
+    """Per-version views of the corpus that every session needs: records, analytics rows and facets."""
+
+    def __init__(self, records):
+        self.records = records
+        self.all_data = []
+        for record in records:
+            # Collect data for analytics
+            mon_id = record.id
+            self.all_data.append({
+                'Title': f"Monument {mon_id}" if mon_id else "Monument",
+                'ID': mon_id if mon_id else "Unknown",
+                'Type': record.type if record.type else 'Not available',
+                'Material': record.material if record.material else 'Not available',
+                'Origin': record.origin if record.origin else 'Not available',
+                'Date': record.date if record.date else 'Not available',
+                'Category': record.category if record.category else 'Not available'
+            })
+        self.facets = record_facets(records)
+
+
+@st.cache_resource(max_entries=1)
+def get_corpus_summary(_corpus: Corpus, version: int) -> CorpusSummary:
+    """Summary of the given corpus version; a new version replaces the old entry."""
+    return CorpusSummary(_corpus.records())
+
+
+@st.cache_resource
+def get_bibliography():
+    """Formatted references by bibliography id (empty if bibliography.xml is missing)."""
+    if not BIBLIO_XML.exists():
+        return MappingProxyType({})
+    snapshot = get_snapshot()
+    refs = snapshot.bibliography_refs() if snapshot is not None else None
+    return MappingProxyType(refs if refs is not None else load_bibliography(str(BIBLIO_XML)))
+
+
+def format_bibliography(entries):
+    """Resolve a record's (bibliography id, page) pairs against the current bibliography."""
+    return format_bibl_entries(entries, get_bibliography())
+
+
+@st.cache_resource
+def get_search_index() -> SearchIndex:
+    """Inverted index of the corpus for the Search & Query tab, patched as files change."""
+    return SearchIndex(format_bibliography).attach(get_corpus())
+
+
+@st.cache_resource
+def get_concordance_index() -> ConcordanceIndex:
+    """Positional index of the editions and translations for the Concordance tab."""
+    return ConcordanceIndex().attach(get_corpus())
+
+
+@st.cache_resource
+def get_element_index() -> ElementIndex:
+    """Index of the edition markup for structural queries in the Search & Query tab."""
+    return ElementIndex().attach(get_corpus())
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    """
+    Search results shared by all sessions, so reruns and popular queries are not
+    searched again. BASHTINA_QUERY_CACHE_SIZE sets how many are kept (0 disables it).
+    """
+    return QueryCache(int(os.getenv("BASHTINA_QUERY_CACHE_SIZE", QUERY_CACHE_SIZE)))
+
+
+@st.cache_resource
+def get_authority_registry():
+    """
+    Parsed authority JSON files by file name. Files that cannot be read are left out,
+    so callers look them up with .get() or handle KeyError. The parsed JSON is shared
+    by every session and must not be modified.
+    """
+    snapshot = get_snapshot()
+    registry = {}
+    for path in sorted(AUTHORITY_DIR.glob('*.json')):
+        try:
+            registry[path.name] = (snapshot.read_authority(path) if snapshot is not None
+                                   else read_json(path))
+        except (OSError, ValueError):
+            continue
+    return MappingProxyType(registry)
+
+
+@st.cache_resource
+def get_network_authorities():
+    """English labels of the authority lists the Network View maps records through."""
+    registry = get_authority_registry()
+    return load_authorities(AUTHORITY_DIR, read=lambda path: registry[Path(path).name])
+
+
+@st.cache_resource(max_entries=1)
+def get_network_view(_corpus: Corpus, version: int):
+    """Network View rows of the given corpus version and the facet bitsets of its filters."""
+    authorities = get_network_authorities()
+    df = network_frame([network_record(record, authorities) for record in _corpus.records()])
+    return df, network_facets(df)
+
+
+@st.cache_resource
+def get_image_index():
+    """
+    Return ({file name: {'data': bytes, 'type': suffix}}, {file name: error}) for the
+    images folder. Every image is checked once with PIL; broken files are reported.
+    """
+    images = {}
+    errors = {}
+    if not IMAGES_DIR.exists():
+        return MappingProxyType(images), MappingProxyType(errors)
+    for extension in IMAGE_EXTENSIONS:
+        for img_path in IMAGES_DIR.glob(extension):
+            try:
+                img_bytes = img_path.read_bytes()
+                # Verify the image can be opened
+                with Image.open(BytesIO(img_bytes)):
+                    pass
+                images[img_path.name] = MappingProxyType({'data': img_bytes, 'type': img_path.suffix.lower()})
+            except Exception as e:
+                errors[img_path.name] = str(e)
+    return MappingProxyType(images), MappingProxyType(errors)
@@ -0,0 +1,501 @@
+"""
+Search over monument records, as used by the Search & Query tab.
+
+scan_records() checks every record for the literal term; SearchIndex answers the
+queries from an inverted index over normalised search keys (see normalize.py)
+that follows the corpus as files change.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from normalize import normalize_edition, normalize_offsets, normalize_text
+
+SEARCH_FIELDS = ["All Fields", "Monument Information", "Church Slavonic Text",
+                 "Translation", "Commentary", "Bibliography"]
+
+
+def scan_records(records, search_term, search_field, format_bibliography):
+    """
+    Return the records containing search_term (case-insensitive) in search_field.
+
+    Every result is a dict with the record's file name, the record and its matches,
+    a list of (section, matched text) pairs. format_bibliography(entries) turns a
+    record's bibliography pairs into the text that is searched.
+    """
+    search_term_lower = search_term.lower().strip()
+    results = []  # Store all matches here
+
+    for record in records:
+        file_matches = []  # Store matches for this file
+
+        # Check monument information first
+        if search_field in ["All Fields", "Monument Information"]:
+            if record.type and search_term_lower in record.type.lower():
+                file_matches.append(("Monument Type", record.type))
+            if record.material and search_term_lower in record.material.lower():
+                file_matches.append(("Material", record.material))
+            if record.origin and search_term_lower in record.origin.lower():
+                file_matches.append(("Origin", record.origin))
+
+        # Search in text sections if needed
+        if search_field in ["Church Slavonic Text", "All Fields"]:
+            text = record.leiden_text
+            if text and search_term_lower in text.lower():
+                file_matches.append(("Church Slavonic Text", text))
+
+        if search_field in ["Translation", "All Fields"]:
+            if record.translation and search_term_lower in record.translation.lower():
+                file_matches.append(("Translation", record.translation))
+
+        if search_field in ["Commentary", "All Fields"]:
+            if record.commentary and search_term_lower in record.commentary.lower():
+                file_matches.append(("Commentary", record.commentary))
+
+        if search_field in ["Bibliography", "All Fields"]:
+            text = format_bibliography(record.bibliography)
+            if text and search_term_lower in text.lower():
+                file_matches.append(("Bibliography", text))
+
+        # If we found matches in this file, add them to the results
+        if file_matches:
+            results.append({
+                'file_name': record.name,
+                'record': record,
+                'matches': file_matches
+            })
+    return results
+
+
+# Searchable sections of a record, in the order their matches are listed
+SECTIONS = ("Title", "Monument Type", "Material", "Origin", "Church Slavonic Text",
+            "Translation", "Commentary", "Bibliography")
+
+# Sections covered by every "Select where to search" option
+FIELD_SECTIONS = {
+    "All Fields": SECTIONS,
+    "Monument Information": ("Title", "Monument Type", "Material", "Origin"),
+    "Church Slavonic Text": ("Church Slavonic Text",),
+    "Translation": ("Translation",),
+    "Commentary": ("Commentary",),
+    "Bibliography": ("Bibliography",),
+}
+
+# The section indexed under both its expanded and abbreviated reading
+EDITION = "Church Slavonic Text"
+
+# How abbreviations in the edition are matched: both readings, or only one of them
+ABBREVIATION_MODES = ("both", "expanded", "abbreviated")
+
+TOKEN_RE = re.compile(r"\w+")
+
+# BM25 parameters, and the weight of a match in each section (1 if not listed)
+BM25_K1 = 1.2
+BM25_B = 0.75
+SECTION_BOOSTS = {"Title": 3.0, "Church Slavonic Text": 2.0}
+
+# Share of the query's trigrams a record must contain to be a fuzzy match (as pg_trgm)
+FUZZY_THRESHOLD = 0.3
+FUZZY_LIMIT = 50
+
+# Number of query results kept by a QueryCache
+QUERY_CACHE_SIZE = 256
+
+
+def tokenize(text):
+    """Lower-cased runs of word characters."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(key):
+    """
+    Character trigrams of a normalised key with its spaces removed, so that
+    fragments read across word divisions and gaps still share trigrams.
+    """
+    text = "".join(TOKEN_RE.findall(key))
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted index from the words of every record section to the records containing them.
+
+    Every section is indexed by its normalised search keys, computed once per
+    record: the edition has an expanded and an abbreviated key, other sections
+    one. Queries are normalised the same way and keep the substring semantics of
+    scan_records(): a query word is looked up in the vocabulary of the searched
+    sections, so it also matches inside longer words, and the records holding all
+    query words are the candidates. Queries that are not a single word are then
+    checked against the candidates' keys, so only candidates are ever touched,
+    and ranked by BM25 with SECTION_BOOSTS weighting the title and the edition.
+    The edition keys are also indexed by character trigram for fuzzy_search(),
+    and the vocabulary by the bigrams and trigrams of its tokens, so the tokens
+    containing a query word are found without scanning the vocabulary.
+    attach() indexes a Corpus and keeps the index up to date through its listeners.
+    """
+
+    def __init__(self, format_bibliography):
+        self.format_bibliography = format_bibliography
+        self.postings = {section: {} for section in SECTIONS}
+        self.vocabulary = {}  # token -> number of sections, over all records, holding it
+        self.token_grams = {}  # bigram or trigram -> {vocabulary tokens holding it}
+        self.texts = {}      # name -> {section: text}
+        self.keys = {}       # name -> {section: (search key, ...)}
+        self.trigrams = {}   # edition trigram -> {names}
+        self.gram_sets = {}  # name -> its edition trigrams
+        self.lengths = {}    # name -> {section: number of tokens}
+        self.section_stats = {section: [0, 0] for section in SECTIONS}  # [records, tokens]
+        self.records = {}    # name -> record
+        self.version = 0     # bumped on every change of the indexed records
+        self.lock = threading.RLock()
+
+    def attach(self, corpus):
+        """Index all records of the corpus and follow its changes."""
+        with corpus.lock:
+            self.update(corpus.by_name, ())
+            corpus.subscribe(lambda changed, removed: self.update(
+                {name: corpus.by_name[name] for name in changed}, removed))
+        return self
+
+    def section_texts(self, record):
+        texts = {
+            "Title": record.title,
+            "Monument Type": record.type,
+            "Material": record.material,
+            "Origin": record.origin,
+            "Church Slavonic Text": record.leiden_text,
+            "Translation": record.translation,
+            "Commentary": record.commentary,
+            "Bibliography": self.format_bibliography(record.bibliography),
+        }
+        return {section: text for section, text in texts.items() if text}
+
+    @staticmethod
+    def search_keys(section, text):
+        """Normalised keys of a section's text: (expanded, abbreviated) for the edition."""
+        if section == EDITION:
+            return normalize_edition(text)
+        return (normalize_text(text),)
+
+    def update(self, records, removed):
+        """(Re)index the given {name: record} and drop the removed names."""
+        with self.lock:
+            for name in list(records) + list(removed):
+                self._remove(name)
+            for name, record in records.items():
+                self._add(name, record)
+            self.version += 1
+
+    def reindex(self):
+        """Re-extract every section, e.g. after the bibliography changed."""
+        with self.lock:
+            self.update(dict(self.records), ())
+
+    def _add(self, name, record):
+        texts = self.section_texts(record)
+        keys = {section: self.search_keys(section, text) for section, text in texts.items()}
+        self.records[name] = record
+        self.texts[name] = texts
+        self.keys[name] = keys
+        self.lengths[name] = lengths = {}
+        for section, section_keys in keys.items():
+            postings = self.postings[section]
+            tokens = tokenize(section_keys[0])
+            lengths[section] = len(tokens)
+            self.section_stats[section][0] += 1
+            self.section_stats[section][1] += len(tokens)
+            for token in set(tokens).union(*map(tokenize, section_keys[1:])):
+                names = postings.get(token)
+                if names is None:
+                    names = postings[token] = set()
+                    if token not in self.vocabulary:
+                        self.vocabulary[token] = 0
+                        for gram in self._grams(token):
+                            self.token_grams.setdefault(gram, set()).add(token)
+                    self.vocabulary[token] += 1
+                names.add(name)
+        if EDITION in keys:
+            grams = set().union(*map(trigrams, keys[EDITION]))
+            self.gram_sets[name] = grams
+            for gram in grams:
+                self.trigrams.setdefault(gram, set()).add(name)
+
+    def _remove(self, name):
+        for gram in self.gram_sets.pop(name, ()):
+            names = self.trigrams[gram]
+            names.discard(name)
+            if not names:
+                del self.trigrams[gram]
+        for section, length in self.lengths.pop(name, {}).items():
+            self.section_stats[section][0] -= 1
+            self.section_stats[section][1] -= length
+        keys = self.keys.pop(name, None)
+        self.texts.pop(name, None)
+        self.records.pop(name, None)
+        if keys is None:
+            return
+        for section, section_keys in keys.items():
+            postings = self.postings[section]
+            for token in set().union(*map(tokenize, section_keys)):
+                names = postings.get(token)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del postings[token]
+                        self.vocabulary[token] -= 1
+                        if not self.vocabulary[token]:
+                            del self.vocabulary[token]
+                            for gram in self._grams(token):
+                                tokens = self.token_grams[gram]
+                                tokens.discard(token)
+                                if not tokens:
+                                    del self.token_grams[gram]
+
+    @staticmethod
+    def _grams(token):
+        """The distinct bigrams and trigrams of a token."""
+        return {token[i:i + n] for n in (2, 3) for i in range(len(token) - n + 1)}
+
+    def _tokens_containing(self, word):
+        """
+        Indexed tokens that contain word. A word of two or three letters is a key of
+        token_grams; a longer one is checked only against the tokens holding its
+        rarest trigram. A single letter is in most tokens, so the vocabulary is scanned.
+        """
+        if len(word) < 2:
+            return [token for token in self.vocabulary if word in token]
+        if len(word) <= 3:
+            return list(self.token_grams.get(word, ()))
+        rarest = min((self.token_grams.get(word[i:i + 3], ()) for i in range(len(word) - 2)), key=len)
+        return [token for token in rarest if word in token]
+
+    def _containing(self, section, tokens):
+        """Names of the records with any of tokens in section."""
+        postings = self.postings[section]
+        names = set()
+        for token in tokens:
+            token_names = postings.get(token)
+            if token_names:
+                names |= token_names
+        return names
+
+    def search(self, search_term, search_field, abbreviations="both", limit=None):
+        """
+        Return the SearchResults of the records whose normalised sections contain
+        the normalised search_term, best BM25 score first.
+
+        abbreviations selects the edition key(s) that are searched: "expanded" reads
+        the expansions in, "abbreviated" leaves them out, "both" matches either form.
+        With a limit only the top limit records are kept.
+        """
+        expanded, abbreviated = normalize_edition(search_term)
+        queries = {section: normalize_text(search_term) for section in FIELD_SECTIONS[search_field]}
+        if EDITION in queries:
+            queries[EDITION] = abbreviated if abbreviations == "abbreviated" else expanded
+        forms = {"both": slice(None), "expanded": slice(0, 1), "abbreviated": slice(1, 2)}[abbreviations]
+
+        with self.lock:
+            matching = {}  # query word -> indexed tokens containing it
+            candidates = {}
+            for section, query in queries.items():
+                words = tokenize(query)
+                if not words:
+                    # Nothing to look up (punctuation only): check the keys themselves
+                    candidates[section] = set(self.keys)
+                    continue
+                for word in words:
+                    if word not in matching:
+                        matching[word] = self._tokens_containing(word)
+                names = self._containing(section, matching[words[0]])
+                for word in words[1:]:
+                    if not names:
+                        break
+                    names &= self._containing(section, matching[word])
+                candidates[section] = names
+
+            # Occurrences of the query per matching record and section, then BM25 over them.
+            # Per-hit state is kept in floats and int bitmasks of the matched sections, which
+            # the garbage collector does not track, so broad queries do not trigger collections
+            # of the whole index.
+            scores = {}
+            sections = {}  # name -> bitmask of the matched SECTIONS
+            all_keys = self.keys
+            for section, query in queries.items():
+                both = section != EDITION or abbreviations == "both"
+                form = 1 if abbreviations == "abbreviated" else 0
+                frequencies = {}
+                for name in candidates[section]:
+                    keys = all_keys[name].get(section)
+                    if not keys:
+                        continue
+                    if not query:
+                        frequency = 1
+                    elif both:
+                        frequency = keys[0].count(query)
+                        if len(keys) > 1:
+                            frequency = max(frequency, keys[1].count(query))
+                    else:
+                        frequency = keys[form].count(query)
+                    if frequency:
+                        frequencies[name] = frequency
+                if not frequencies:
+                    continue
+                records, tokens = self.section_stats[section]
+                average = tokens / records if records else 1
+                idf = math.log(1 + (records - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+                weight = SECTION_BOOSTS.get(section, 1.0) * idf * (BM25_K1 + 1)
+                bit = 1 << SECTIONS.index(section)
+                lengths = self.lengths
+                for name, frequency in frequencies.items():
+                    norm = 1 - BM25_B + BM25_B * lengths[name][section] / (average or 1)
+                    scores[name] = scores.get(name, 0.0) + weight * frequency / (frequency + BM25_K1 * norm)
+                    sections[name] = sections.get(name, 0) | bit
+
+            # Best score first, ties by name
+            if limit is None:
+                names = sorted(scores)
+                names.sort(key=scores.__getitem__, reverse=True)
+            else:
+                names = heapq.nlargest(limit, sorted(scores), key=scores.__getitem__)
+            return SearchResults(self, names, scores, sections)
+
+    def fuzzy_search(self, search_term, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+        """
+        Rank the editions by the share of the query's trigrams they contain.
+
+        The query is normalised like the edition, so misspelled, partial or
+        lacunose forms still match: one wrong letter costs at most three trigrams.
+        Returns SearchResults scored by that share, between threshold and 1, with
+        the best limit of them (all if limit is None), best first. Queries too
+        short for a trigram fall back to search().
+        """
+        expanded, abbreviated = normalize_edition(search_term)
+        grams = trigrams(expanded) | trigrams(abbreviated)
+        if not grams:
+            results = self.search(search_term, EDITION, limit=limit)
+            return SearchResults(self, results.names, dict.fromkeys(results.names, 1.0), results.sections)
+
+        with self.lock:
+            counts = Counter()
+            for gram in grams:
+                counts.update(self.trigrams.get(gram, ()))
+            needed = threshold * len(grams)
+            names = sorted(name for name, count in counts.items() if count >= needed)
+            if limit is None:
+                names.sort(key=counts.__getitem__, reverse=True)
+            else:
+                names = heapq.nlargest(limit, names, key=counts.__getitem__)
+            edition = 1 << SECTIONS.index(EDITION)
+            return SearchResults(self, names, {name: counts[name] / len(grams) for name in names},
+                                 dict.fromkeys(names, edition))
+
+
+class SearchResults:
+    """
+    Ranked names of a query's records with their scores and, as a bitmask over
+    SECTIONS, the sections they matched in. Result dicts, with the record and the
+    text of every matched section, are only built for the page that is shown.
+    """
+
+    def __init__(self, index, names, scores=None, sections=None):
+        self.index = index
+        self.names = names
+        self.scores = scores or {}
+        self.sections = sections or {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def filter(self, keep):
+        """The results whose name passes keep(name), in the same order."""
+        return SearchResults(self.index, [name for name in self.names if keep(name)],
+                             self.scores, self.sections)
+
+    def page(self, number, size):
+        """Result dicts of page number (from 1) with size results per page."""
+        with self.index.lock:
+            results = []
+            for name in self.names[(number - 1) * size:number * size]:
+                texts = self.index.texts.get(name)
+                if texts is None:  # removed since the query ran
+                    continue
+                mask = self.sections.get(name, 0)
+                results.append({'file_name': name, 'record': self.index.records[name],
+                                'score': self.scores.get(name, 0.0),
+                                'matches': [(section, texts[section]) for i, section in enumerate(SECTIONS)
+                                            if mask >> i & 1 and section in texts]})
+            return results
+
+
+def snippet(text, section, search_term, width=60):
+    """
+    The first match of search_term in a section's text with width characters of
+    context on each side, located through the normalised key so that sigla and
+    diacritics in the text do not hide it. The start of the text if there is none.
+    """
+    edition = section == EDITION
+    key, offsets = normalize_offsets(text, edition)
+    query = normalize_edition(search_term)[0] if edition else normalize_text(search_term)
+    position = key.find(query) if query else -1
+    if position < 0:
+        start = end = 0
+    else:
+        start, end = offsets[position], offsets[position + len(query) - 1] + 1
+    left = max(0, start - width)
+    right = min(len(text), end + width)
+    return ("…" if left else "") + " ".join(text[left:right].split()) + ("…" if right < len(text) else "")
+
+
+def query_key(search_term, *options, structural=False):
+    """
+    Cache key of a query: its normalised forms (as searched) and the other
+    options. Structural queries match tags and attributes case-sensitively, so
+    they are keyed by the term itself with only its whitespace collapsed.
+    """
+    if structural:
+        return (" ".join(search_term.split()), *options)
+    return (normalize_text(search_term), *normalize_edition(search_term), *options)
+
+
+class QueryCache:
+    """
+    LRU cache of SearchResults with hit and miss counters.
+
+    Entries belong to one version of the data, e.g. (corpus version, index
+    version); a lookup with another version drops them all, so results never
+    outlive the records they were computed from.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version, compute):
+        """Cached results for key, or compute() them and keep them as most recent."""
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            results = self.entries.get(key)
+            if results is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return results
+            self.misses += 1
+        results = compute()
+        with self.lock:
+            if version == self.version and self.maxsize > 0:
+                self.entries[key] = results
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,183 @@
+"""
+Precompiled corpus snapshot for fast cold starts.
+
+``python snapshot.py build`` compiles data/xmls, data/authority/*.json and
+data/bibliography.xml into one binary file holding the extracted monument
+records (with their rendered Leiden text), the authority lists and the
+formatted bibliography, together with a manifest of the source files.
+The application seeds its corpus from the snapshot and only parses files
+whose manifest entry no longer matches what is on disk.
+
+The snapshot is a single pickle rather than Arrow/msgpack so that it needs no
+dependencies beyond the standard library.
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bibliography import load_bibliography
+from corpus import CACHE_VERSION, RECORD_FIELDS, content_hash, file_signature, ingest_files, list_xml_files
+from network_data import read_json
+from records import extract_record
+
+SNAPSHOT_MAGIC = b"BASHTINA-SNAPSHOT\n"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "corpus.snapshot"
+
+
+class Snapshot:
+    """
+    Loaded snapshot contents.
+
+    ``manifest`` maps each source path, relative to the data folder, to the
+    (mtime_ns, size) signature and content hash it had at build time.
+    """
+
+    def __init__(self, data_dir, manifest, records, authority, bibliography, built_at):
+        self.data_dir = Path(data_dir)
+        self.manifest = manifest
+        self.records = records
+        self.authority = authority
+        self.bibliography = bibliography
+        self.built_at = built_at
+
+    def is_fresh(self, relative_path) -> bool:
+        """True if the source file still has the signature or content it was compiled from."""
+        known = self.manifest.get(str(relative_path))
+        path = self.data_dir / relative_path
+        if known is None or not path.is_file():
+            return False
+        signature, digest = known
+        return file_signature(path) == signature or content_hash(path.read_bytes()) == digest
+
+    def corpus_entries(self) -> dict:
+        """Return {file name: (signature, digest, record)} for seeding a Corpus."""
+        entries = {}
+        for name, record in self.records.items():
+            signature, digest = self.manifest[f"xmls/{name}"]
+            entries[name] = (signature, digest, record)
+        return entries
+
+    def authority_json(self, file_name):
+        """Return the parsed authority file, or None if it changed since the build."""
+        if file_name in self.authority and self.is_fresh(f"authority/{file_name}"):
+            return self.authority[file_name]
+        return None
+
+    def read_authority(self, path):
+        """Read an authority JSON file, served from the snapshot while it is unchanged."""
+        data = self.authority_json(Path(path).name)
+        return data if data is not None else read_json(path)
+
+    def bibliography_refs(self):
+        """Return the formatted bibliography, or None if bibliography.xml changed since the build."""
+        if self.bibliography is not None and self.is_fresh("bibliography.xml"):
+            return self.bibliography
+        return None
+
+
+def _manifest_entry(path):
+    return file_signature(path), content_hash(Path(path).read_bytes())
+
+
+def build_snapshot(data_dir, output_path, workers=None):
+    """Compile the data folder into a snapshot file; return the ingestion report."""
+    data_dir = Path(data_dir)
+    manifest = {}
+
+    xml_dir = data_dir / 'xmls'
+    items = []
+    for name in list_xml_files(xml_dir):
+        data = (xml_dir / name).read_bytes()
+        manifest[f"xmls/{name}"] = (file_signature(xml_dir / name), content_hash(data))
+        items.append((name, data))
+    report = ingest_files(items, extract_record, workers)
+
+    authority = {}
+    for path in sorted((data_dir / 'authority').glob('*.json')):
+        authority[path.name] = read_json(path)
+        manifest[f"authority/{path.name}"] = _manifest_entry(path)
+
+    bibliography = None
+    biblio_xml = data_dir / 'bibliography.xml'
+    if biblio_xml.exists():
+        bibliography = load_bibliography(str(biblio_xml))
+        manifest["bibliography.xml"] = _manifest_entry(biblio_xml)
+
+    payload = {
+        'version': SNAPSHOT_VERSION,
+        'records_version': CACHE_VERSION,
+        'records_fields': RECORD_FIELDS,
+        'built_at': time.time(),
+        'manifest': manifest,
+        'records': report.records,
+        'authority': authority,
+        'bibliography': bibliography,
+    }
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # mkstemp creates the file owner-only; the snapshot is meant to ship with the app
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, output_path)
+    return report
+
+
+def load_snapshot(snapshot_path, data_dir):
+    """
+    Load a snapshot built for this version of the records, or return None.
+    Staleness is checked per source file by the caller (see Snapshot.is_fresh).
+    """
+    try:
+        with open(snapshot_path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if (payload.get('version') != SNAPSHOT_VERSION or payload.get('records_version') != CACHE_VERSION
+            or payload.get('records_fields') != RECORD_FIELDS):
+        return None
+    return Snapshot(data_dir, payload['manifest'], payload['records'],
+                    payload['authority'], payload['bibliography'], payload['built_at'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the precompiled corpus snapshot.")
+    parser.add_argument('command', choices=['build', 'check'])
+    parser.add_argument('--data-dir', default=str(Path(__file__).resolve().parent / 'data'))
+    parser.add_argument('--output', help=f"snapshot file (default: <data-dir>/{SNAPSHOT_FILE})")
+    parser.add_argument('--workers', type=int, help="ingestion worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+    output = args.output or str(Path(args.data_dir) / SNAPSHOT_FILE)
+
+    if args.command == 'build':
+        report = build_snapshot(args.data_dir, output, args.workers)
+        for name, error in report.errors.items():
+            print(f"skipped {name}: {error}", file=sys.stderr)
+        print(f"Compiled {len(report.records)} records in {report.elapsed:.2f} s "
+              f"using {report.workers} worker(s) into {output}")
+        return 1 if report.errors else 0
+
+    start = time.perf_counter()
+    snapshot = load_snapshot(output, args.data_dir)
+    if snapshot is None:
+        print(f"{output} is missing or was built by another version")
+        return 1
+    stale = [path for path in snapshot.manifest if not snapshot.is_fresh(path)]
+    print(f"Loaded {len(snapshot.records)} records in {time.perf_counter() - start:.3f} s; "
+          f"{len(stale)} stale source file(s)")
+    for path in stale:
+        print(f"  {path}")
+    return 1 if stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
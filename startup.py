@@ -0,0 +1,90 @@
+"""
+Deferred imports of the heavy visualisation libraries and a per-module import-time profile.
+
+lazy_module(name) returns a stand-in that imports the module on first attribute
+access, so a library needed by a single tab is only paid for when that tab is
+used. Eager imports can be measured with ``with timed_import(name):``. Every first
+import is recorded in IMPORT_TIMES; set BASHTINA_IMPORT_PROFILE=1 to have the
+application print the profile, or run ``python startup.py`` to time each
+deferred library on its own.
+"""
+import importlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+PROFILE_ENV = "BASHTINA_IMPORT_PROFILE"
+
+# module name -> seconds spent on its first import in this process
+IMPORT_TIMES = {}
+
+# Libraries the application defers until a tab needs them
+DEFERRED_MODULES = (
+    "plotly.express", "pydeck", "folium", "streamlit_folium", "PIL.Image",
+)
+
+
+def profile_enabled() -> bool:
+    return os.getenv(PROFILE_ENV, "") not in ("", "0")
+
+
+@contextmanager
+def timed_import(name):
+    """Record how long the import statements in the block take, the first time only."""
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    yield
+    if not already_loaded:
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+
+
+def import_module(name):
+    """importlib.import_module, recorded in IMPORT_TIMES."""
+    with timed_import(name):
+        return importlib.import_module(name)
+
+
+class LazyModule:
+    """Module stand-in that performs the import on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name) -> LazyModule:
+    return LazyModule(name)
+
+
+def import_profile() -> list:
+    """Return the recorded imports as (module, seconds) pairs, slowest first."""
+    return sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True)
+
+
+def format_import_profile() -> str:
+    lines = [f"{seconds * 1000:9.1f} ms  {name}" for name, seconds in import_profile()]
+    lines.append(f"{sum(IMPORT_TIMES.values()) * 1000:9.1f} ms  total")
+    return "\n".join(lines)
+
+
+def main():
+    """Time the import of every deferred library in this (otherwise fresh) process."""
+    with timed_import("streamlit"):
+        import streamlit  # noqa: F401  (shared by all of them; measured separately)
+    for name in DEFERRED_MODULES:
+        import_module(name)
+    print(format_import_profile())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Structural queries over the EpiDoc markup of the editions.
+
+Every record counts the elements of its edition by tag, attributes and
+textpart (MonumentRecord.elements). ElementIndex inverts these counts into
+postings from a tag, or a tag and one attribute, to the (record, textpart)
+locations holding such an element, so a query intersects a few posting sets
+instead of walking the XML of every document. Queries are written like the
+elements they look for:
+
+    <gap unit="line">
+    <supplied reason='lost' cert='low'>
+    <g type="cross"> in textpart II
+    <supplied cert> & <g type="cross">
+
+An attribute without a value only has to be present, a tag of * matches any
+element, and clauses joined with & (or "and") must all occur in a record.
+"""
+import re
+import threading
+
+STRUCTURE_SECTION = "Edition markup"
+
+_CLAUSE = re.compile(
+    r"""<\s*(?P<tag>[\w.*-]+)(?P<attributes>(?:\s+[\w.:-]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'<>/]+))?)*)\s*/?\s*>"""
+    r"""(?:\s+in\s+(?:textpart\s+)?(?P<textpart>[^\s&<>]+))?""", re.IGNORECASE)
+_ATTRIBUTE = re.compile(r"""([\w.:-]+)(\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'<>/]+)))?""")
+_JOINERS = re.compile(r"&|\band\b", re.IGNORECASE)
+
+
+def parse_query(text):
+    """
+    Clauses of a structural query as (tag, ((attribute, value or None), ...),
+    textpart or None) triples. Raises ValueError for anything else.
+    """
+    clauses = []
+    for match in _CLAUSE.finditer(text):
+        attributes = []
+        for name, assigned, double, single, bare in _ATTRIBUTE.findall(match.group('attributes')):
+            # Attributes are indexed by local name (xml:lang as lang)
+            attributes.append((name.rsplit(':', 1)[-1], (double or single or bare) if assigned else None))
+        if match.group('tag') == '*' and not attributes:
+            raise ValueError("A query for any element (*) needs at least one attribute.")
+        clauses.append((match.group('tag'), tuple(attributes), match.group('textpart')))
+    rest = _JOINERS.sub(" ", _CLAUSE.sub(" ", text)).strip()
+    if rest or not clauses:
+        raise ValueError('Write structural queries as elements, e.g. <gap unit="line"> '
+                         "or <g type=\"cross\"> in textpart II, joined with &.")
+    return clauses
+
+
+def describe(clause):
+    """The clause written back in query syntax."""
+    tag, attributes, textpart = clause
+    written = "".join(f' {name}' if value is None else f' {name}="{value}"' for name, value in attributes)
+    return f"<{tag}{written}>" + (f" in textpart {textpart}" if textpart else "")
+
+
+class ElementIndex:
+    """
+    Postings from element tags and attribute values to the locations holding them.
+
+    A location is a (name, textpart) pair. postings is keyed by (tag,),
+    (tag, attribute) and (tag, attribute, value), the latter two also with a
+    tag of * for any element, and counts the matching elements per location, so
+    a clause with a single condition is answered from one posting. A clause
+    with several attribute conditions intersects their postings and checks the
+    elements of the remaining locations, kept in elements by tag, as the
+    conditions must hold for the same element. attach() follows a Corpus like
+    SearchIndex.
+    """
+
+    def __init__(self):
+        self.postings = {}   # key -> {(name, textpart): number of elements}
+        self.elements = {}   # name -> {textpart: {tag: [(attributes, count)]}}
+        self.records = {}    # name -> record
+        self.version = 0
+        self.lock = threading.RLock()
+
+    def attach(self, corpus):
+        """Index all records of the corpus and follow its changes."""
+        with corpus.lock:
+            self.update(corpus.by_name, ())
+            corpus.subscribe(lambda changed, removed: self.update(
+                {name: corpus.by_name[name] for name in changed}, removed))
+        return self
+
+    def update(self, records, removed):
+        """(Re)index the given {name: record} and drop the removed names."""
+        with self.lock:
+            for name in list(records) + list(removed):
+                self._remove(name)
+            for name, record in records.items():
+                self._add(name, record)
+            self.version += 1
+
+    @staticmethod
+    def _keys(tag, attributes):
+        yield (tag,)
+        for name, value in attributes:
+            for key_tag in (tag, '*'):
+                yield (key_tag, name)
+                yield (key_tag, name, value)
+
+    def _add(self, name, record):
+        self.records[name] = record
+        parts = self.elements[name] = {}
+        locations = {}
+        for (tag, attributes, textpart), count in record.elements or ():
+            location = locations.get(textpart)
+            if location is None:
+                location = locations[textpart] = (name, textpart)
+            parts.setdefault(textpart, {}).setdefault(tag, []).append((attributes, count))
+            for key in self._keys(tag, attributes):
+                postings = self.postings.get(key)
+                if postings is None:
+                    postings = self.postings[key] = {}
+                postings[location] = postings.get(location, 0) + count
+
+    def _remove(self, name):
+        parts = self.elements.pop(name, None)
+        if parts is None:
+            return
+        del self.records[name]
+        for textpart, tags in parts.items():
+            location = (name, textpart)
+            for tag, elements in tags.items():
+                for attributes, _ in elements:
+                    for key in self._keys(tag, attributes):
+                        postings = self.postings.get(key)
+                        if postings is not None:
+                            postings.pop(location, None)
+                            if not postings:
+                                del self.postings[key]
+
+    def _count(self, location, clause):
+        """Number of elements at location satisfying all conditions of the clause."""
+        tag, conditions, _ = clause
+        tags = self.elements[location[0]][location[1]]
+        count = 0
+        for element_tag in (tags if tag == '*' else (tag,)):
+            for attributes, n in tags.get(element_tag, ()):
+                values = dict(attributes)
+                if all(name in values and (value is None or values[name] == value)
+                       for name, value in conditions):
+                    count += n
+        return count
+
+    def _matches(self, clause):
+        """{name: [(textpart, count)]} of the locations matching one clause."""
+        tag, attributes, textpart = clause
+        keys = [(tag, name) if value is None else (tag, name, value) for name, value in attributes] or [(tag,)]
+        postings = sorted((self.postings.get(key, {}) for key in keys), key=len)
+        if len(postings) == 1:
+            counts = postings[0].items()
+        else:
+            locations = set(postings[0]).intersection(*postings[1:])
+            counts = [(location, self._count(location, clause)) for location in locations]
+        if textpart is not None:
+            textpart = textpart.casefold()
+        found = {}
+        for location, count in counts:
+            if count and (textpart is None or location[1].casefold() == textpart):
+                found.setdefault(location[0], []).append((location[1], count))
+        return found
+
+    def query(self, text, limit=None):
+        """
+        StructureResults of a structural query, the records with the most
+        matching elements first (at most limit of them). Raises ValueError if
+        the query cannot be parsed.
+        """
+        clauses = parse_query(text)
+        with self.lock:
+            per_clause = [self._matches(clause) for clause in clauses]
+        names = set(per_clause[0]).intersection(*per_clause[1:])
+        found = {name: [(clause, textpart, count)
+                        for clause, matches in zip(clauses, per_clause)
+                        for textpart, count in sorted(matches[name])]
+                 for name in names}
+        scores = {name: float(sum(count for _, _, count in hits)) for name, hits in found.items()}
+        ordered = sorted(names)
+        ordered.sort(key=scores.get, reverse=True)
+        return StructureResults(self, ordered[:limit], scores, found)
+
+
+class StructureResults:
+    """
+    Names of the records matching a structural query, with the number of
+    matching elements as their score. page() returns result dicts shaped like
+    SearchResults.page(), each match describing the elements found.
+    """
+
+    def __init__(self, index, names, scores, found):
+        self.index = index
+        self.names = names
+        self.scores = scores
+        self.found = found
+
+    def __len__(self):
+        return len(self.names)
+
+    def filter(self, keep):
+        """The results whose name passes keep(name), in the same order."""
+        return StructureResults(self.index, [name for name in self.names if keep(name)],
+                                self.scores, self.found)
+
+    def page(self, number, size):
+        """Result dicts of page number (from 1) with size results per page."""
+        with self.index.lock:
+            results = []
+            for name in self.names[(number - 1) * size:number * size]:
+                record = self.index.records.get(name)
+                if record is None:  # removed since the query ran
+                    continue
+                matches = [(STRUCTURE_SECTION, f"{describe(clause[:2] + (textpart,))}: {count}×")
+                           for clause, textpart, count in self.found[name]]
+                results.append({'file_name': name, 'record': record,
+                                 'score': self.scores[name], 'matches': matches})
+            return results
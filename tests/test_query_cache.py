@@ -0,0 +1,35 @@
+"""Structural queries differing only in case must not share a query cache entry."""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search import QueryCache, query_key  # noqa: E402
+from structure import ElementIndex  # noqa: E402
+
+
+def element_index():
+    record = SimpleNamespace(elements=((("g", (("type", "cross"),), ""), 1),))
+    index = ElementIndex()
+    index.update({"cross.xml": record}, ())
+    return index
+
+
+def cached_query(cache, index, term):
+    key = query_key(term, "Structure", "All Fields", "both", None, (), structural=True)
+    return cache.get(key, index.version, lambda: index.query(term)).names
+
+
+def test_structural_queries_are_cached_by_case():
+    index = element_index()
+    cache = QueryCache()
+    assert cached_query(cache, index, '<G TYPE="CROSS">') == []
+    assert cached_query(cache, index, '<g type="cross">') == ["cross.xml"]
+    assert cached_query(cache, index, '<G TYPE="CROSS">') == []
+    assert cache.misses == 2 and cache.hits == 1
+
+
+def test_structural_query_keys_collapse_whitespace():
+    assert query_key('<g  type="cross">\n', "Structure", structural=True) == \
+        query_key('<g type="cross">', "Structure", structural=True)